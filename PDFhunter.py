@@ -1,21 +1,351 @@
+import time
+STARTUP_STARTED = time.perf_counter()
+
 import discord
 from discord.ext import commands
 from discord import app_commands
+import abc
+import aiohttp
+import asyncio
+import atexit
+import contextlib
+import copy
+import functools
+import gzip
+import hashlib
+import heapq
+import html
 import json
+import logging
 import os
-import io
-from datetime import datetime, timedelta
+import re
+import sys
+import tempfile
+import threading
+import traceback
+import zlib
+from collections import Counter, OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta, timezone
 from typing import Literal
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# ==================== STARTUP ====================
+
+class StartupProfile:
+    # Time spent in each startup phase; printed once the bot is ready when
+    # run with --profile-startup
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = []
+        self.background = []
+        self.enabled = False
+        self.ready = False
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last, now - self.started))
+        self.last = now
+
+    def spawn(self, phase, coro):
+        # Background phases overlap the others, so they are timed on their own
+        async def run():
+            started = time.perf_counter()
+            await coro
+            now = time.perf_counter()
+            self.phases.append((f"{phase} (background)", now - started, now - self.started))
+
+        task = asyncio.get_running_loop().create_task(run())
+        self.background.append(task)
+        return task
+
+    def report(self):
+        lines = [f"[startup] {'phase':<32} {'took':>10} {'done at':>10}"]
+        for phase, took, done_at in sorted(self.phases, key=lambda phase: phase[2]):
+            lines.append(f"[startup] {phase:<32} {took * 1000:8.1f}ms {done_at * 1000:8.1f}ms")
+        return "\n".join(lines)
+
+startup = StartupProfile(STARTUP_STARTED)
+startup.mark("imports")
+
+# ==================== METRICS ====================
+
+# Local Prometheus endpoint (disabled unless METRICS_PORT is set) and how often
+# a metrics summary is printed (0 disables it)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "300"))
+# The event loop is reported as blocked when it stalls for longer than this
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250")) / 1000
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+def route_template(path):
+    path = re.sub(r"/(interactions|webhooks)/(\d+)/[^/]+", r"/\1/{id}/{token}", path)
+    return re.sub(r"/\d{15,21}", "/{id}", path)
+
+class Metrics:
+    def __init__(self):
+        self.latency = defaultdict(Histogram)
+        self.errors = Counter()
+        self.api_calls = Counter()
+        self.rate_limits = 0
+        self.rate_limit_wait = 0.0
+        self.loop_blocks = 0
+        self.loop_blocked = 0.0
+        self.member_lookups = Counter()
+
+    def observe(self, name, seconds, error=False):
+        self.latency[name].observe(seconds)
+        if error:
+            self.errors[name] += 1
+
+    def trace_config(self):
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_end(session, context, params):
+            if params.url.host == "discord.com":
+                self.api_calls[(params.method, route_template(params.url.path))] += 1
+
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    def render(self):
+        lines = [
+            "# TYPE pdfhunter_command_latency_seconds histogram",
+        ]
+        for name, histogram in sorted(self.latency.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                cumulative += count
+                lines.append(f'pdfhunter_command_latency_seconds_bucket{{command="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'pdfhunter_command_latency_seconds_bucket{{command="{name}",le="+Inf"}} {histogram.count}')
+            lines.append(f'pdfhunter_command_latency_seconds_sum{{command="{name}"}} {histogram.total}')
+            lines.append(f'pdfhunter_command_latency_seconds_count{{command="{name}"}} {histogram.count}')
+        lines.append("# TYPE pdfhunter_command_errors_total counter")
+        for name, count in sorted(self.errors.items()):
+            lines.append(f'pdfhunter_command_errors_total{{command="{name}"}} {count}')
+        lines.append("# TYPE pdfhunter_api_requests_total counter")
+        for (method, route), count in sorted(self.api_calls.items()):
+            lines.append(f'pdfhunter_api_requests_total{{method="{method}",route="{route}"}} {count}')
+        lines += [
+            "# TYPE pdfhunter_rate_limits_total counter",
+            f"pdfhunter_rate_limits_total {self.rate_limits}",
+            "# TYPE pdfhunter_rate_limit_wait_seconds_total counter",
+            f"pdfhunter_rate_limit_wait_seconds_total {self.rate_limit_wait}",
+            "# TYPE pdfhunter_loop_blocks_total counter",
+            f"pdfhunter_loop_blocks_total {self.loop_blocks}",
+            "# TYPE pdfhunter_loop_blocked_seconds_total counter",
+            f"pdfhunter_loop_blocked_seconds_total {self.loop_blocked}",
+            "# TYPE pdfhunter_member_lookups_total counter",
+        ]
+        for source, count in sorted(self.member_lookups.items()):
+            lines.append(f'pdfhunter_member_lookups_total{{source="{source}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def member_hit_rate(self):
+        total = sum(self.member_lookups.values())
+        hits = self.member_lookups["hit"] + self.member_lookups["gateway"]
+        return hits / total if total else 1.0
+
+    def summary(self):
+        slowest = sorted(self.latency.items(), key=lambda item: item[1].total / item[1].count, reverse=True)[:5]
+        commands_text = ", ".join(
+            f"{name} n={h.count} p50<={h.quantile(0.5)}s p99<={h.quantile(0.99)}s" for name, h in slowest
+        ) or "none"
+        return (
+            f"[metrics] commands: {commands_text} | errors: {sum(self.errors.values())} | "
+            f"api calls: {sum(self.api_calls.values())} | rate limits: {self.rate_limits} "
+            f"({self.rate_limit_wait:.1f}s waited) | loop blocks: {self.loop_blocks} ({self.loop_blocked:.2f}s) | "
+            f"member cache: {sum(self.member_lookups.values())} lookups, {self.member_hit_rate():.0%} hits"
+        )
+
+metrics = Metrics()
+
+class RateLimitCounter(logging.Handler):
+    # discord.py only reports 429 retries through its logger
+    def emit(self, record):
+        if record.getMessage().startswith("We are being rate limited"):
+            metrics.rate_limits += 1
+            if isinstance(record.args, tuple) and record.args and isinstance(record.args[-1], float):
+                metrics.rate_limit_wait += record.args[-1]
+
+logging.getLogger("discord.http").addHandler(RateLimitCounter(logging.WARNING))
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            error = False
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                metrics.observe(name, time.perf_counter() - started, error)
+        return wrapper
+    return decorator
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    # Start times are stamped here; completion is recorded by the
+    # on_app_command_completion listener and failures by on_error.
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        started = interaction.extras.get("started")
+        if started is not None and interaction.command is not None:
+            metrics.observe(interaction.command.qualified_name, time.perf_counter() - started, error=True)
+        await super().on_error(interaction, error)
+
+class LoopWatchdog:
+    # A loop task refreshes a heartbeat; a separate thread notices when the
+    # heartbeat goes stale and prints what the loop thread is stuck on.
+    def __init__(self, threshold, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.heartbeat = time.monotonic()
+        self.loop_thread = None
+        self._reported = False
+
+    async def run(self):
+        self.loop_thread = threading.get_ident()
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        while True:
+            before = time.monotonic()
+            self.heartbeat = before
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - before - self.interval
+            self._reported = False
+            if lag > self.threshold:
+                metrics.loop_blocks += 1
+                metrics.loop_blocked += lag
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            stalled = time.monotonic() - self.heartbeat - self.interval
+            if stalled > self.threshold and not self._reported:
+                self._reported = True
+                frame = sys._current_frames().get(self.loop_thread)
+                stack = "".join(traceback.format_stack(frame)) if frame else "  (no frame)\n"
+                print(f"Warning: event loop blocked for {stalled * 1000:.0f}ms, loop thread is at:\n{stack}", end="")
+
+async def serve_metrics(port):
+    # Only pulled in when the endpoint is enabled
+    from aiohttp import web
+    
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+
+async def log_metrics(interval):
+    while True:
+        await asyncio.sleep(interval)
+        print(metrics.summary())
+
+def parse_shard_ids(text):
+    # "0-3,6" -> [0, 1, 2, 3, 6]
+    shard_ids = []
+    for part in text.split(","):
+        start, _, end = part.strip().partition("-")
+        shard_ids += range(int(start), int(end or start) + 1)
+    return shard_ids
 
-# File to store ticket configuration
-CONFIG_FILE = "ticket_config.json"
+def shard_settings(count_text, ids_text):
+    # Checked before the bot is built, so a bad setup fails with a message
+    # that names the variables instead of a discord.py traceback
+    try:
+        shard_count = int(count_text or "0") or None
+        shard_ids = parse_shard_ids(ids_text) if ids_text else None
+    except ValueError:
+        sys.exit(f"SHARD_COUNT must be a number and SHARD_IDS a list like 0-3,6 (got {count_text!r}, {ids_text!r})")
+    if shard_ids is not None and shard_count is None:
+        sys.exit("SHARD_IDS needs SHARD_COUNT, the total number of shards across all processes")
+    if shard_ids is not None and not all(0 <= shard_id < shard_count for shard_id in shard_ids):
+        sys.exit(f"SHARD_IDS must be between 0 and {shard_count - 1} for SHARD_COUNT={shard_count}")
+    return shard_count, shard_ids
+
+# SHARD_COUNT alone runs every shard in this process, SHARD_COUNT plus
+# SHARD_IDS (e.g. "0-3") runs a range so several processes can split the
+# shards. AUTO_SHARD=1 lets Discord pick the shard count.
+SHARD_COUNT, SHARD_IDS = shard_settings(os.getenv("SHARD_COUNT"), os.getenv("SHARD_IDS"))
+SHARDED = bool(SHARD_COUNT or SHARD_IDS or os.getenv("AUTO_SHARD") == "1")
+
+bot = (commands.AutoShardedBot if SHARDED else commands.Bot)(
+    **({"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARDED else {}),
+    command_prefix="!",
+    intents=intents,
+    tree_cls=InstrumentedCommandTree,
+    http_trace=metrics.trace_config(),
+    # Members are resolved on demand (see MemberCache) instead of downloading
+    # every member list on connect
+    chunk_guilds_at_startup=False
+)
+
+# Per-guild ticket configuration and counters live in GUILD_DATA_DIR/<guild_id>/
+GUILD_DATA_DIR = "guilds"
+CONFIG_FILE = "config.json"
 TICKET_COUNTER_FILE = "ticket_counter.json"
+TICKET_REGISTRY_FILE = "tickets.json"
+TICKET_LOG_FILE = "tickets.log"
+
+# "json" keeps the files above; "sqlite" keeps them in one database that
+# several shard processes can share (existing JSON files are imported)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "pdfhunter.db")
+
+# Single-guild files from older versions, migrated on first use
+LEGACY_CONFIG_FILE = "ticket_config.json"
+LEGACY_TICKET_COUNTER_FILE = "ticket_counter.json"
+
+# Transcripts are kept in memory up to this size, then spill to a temp file
+TRANSCRIPT_SPOOL_SIZE = 1024 * 1024
+
+# Searchable archive of closed tickets' messages (see /ticket_search)
+TRANSCRIPT_ARCHIVE_PATH = os.getenv("TRANSCRIPT_ARCHIVE_PATH", "transcripts.db")
+SEARCH_PAGE_SIZE = 10
+
+# Ticket creation token buckets as (burst size, seconds to refill one token)
+TICKET_USER_RATE = (3, 120)
+TICKET_GUILD_RATE = (30, 2)
 
 # Default configuration
 default_config = {
@@ -23,30 +353,778 @@ default_config = {
     "transcript_channel": None,
     "support_roles": [],
     "ticket_type": "button",
-    "ticket_message": None
+    "ticket_message": None,
+    "live_transcripts": False,
+    "transcript_format": "text",
+    "transcript_compression": "none",
+    "max_tickets_per_user": 3,
+    "auto_close_after": 0,
+    "auto_close_warning": 3600,
+    "ticket_pool_size": 0,
+    "raid_protection": False,
+    "raid_joins": 10,
+    "raid_seconds": 10,
+    "raid_action": "alert",
+    "raid_timeout_minutes": 60,
+    "raid_alert_channel": None,
+    "raid_lockdown": {}
 }
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    return default_config.copy()
+class ConfigStore:
+    # Serves the config from memory, writes changes back in the background and
+    # picks up edits made to the file on disk (checked at most every second).
+    def __init__(self, path, defaults, check_interval=1.0, flush_delay=0.5):
+        self.path = path
+        self.defaults = defaults
+        self.check_interval = check_interval
+        self.flush_delay = flush_delay
+        self._data = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._dirty = False
+        self._flush_task = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.load()
+        else:
+            self._maybe_reload()
+        return self._data
+
+    def load(self):
+        stored, self._mtime = self._read()
+        self._data = {**copy.deepcopy(self.defaults), **(stored or {})}
+        self._last_check = time.monotonic()
+        self._dirty = False
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._dirty or now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        mtime = self._version()
+        if mtime is not None and mtime != self._mtime:
+            print(f"{self.path} changed on disk, reloading")
+            self.load()
+
+    # Storage hooks; the version is anything that changes on every write
+    def _read(self):
+        if not os.path.exists(self.path):
+            return None, None
+        with open(self.path, 'r') as f:
+            return json.load(f), os.stat(self.path).st_mtime_ns
 
-def save_config(config):
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=4)
+    def _version(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
 
-def load_ticket_counter():
-    if os.path.exists(TICKET_COUNTER_FILE):
-        with open(TICKET_COUNTER_FILE, 'r') as f:
-            return json.load(f)
-    return {"counter": 0}
+    def _write(self, payload):
+        return atomic_write(self.path, payload)
 
-def save_ticket_counter(counter_data):
-    with open(TICKET_COUNTER_FILE, 'w') as f:
-        json.dump(counter_data, f, indent=4)
+    def save(self):
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later())
 
-config = load_config()
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        while self._dirty:
+            self._dirty = False
+            payload = json.dumps(self._data, indent=4)
+            try:
+                self._mtime = await asyncio.to_thread(self._write, payload)
+            except OSError as e:
+                self._dirty = True
+                print(f"Error saving {self.path}: {e}")
+                return
+
+    def flush(self):
+        if self._dirty:
+            self._dirty = False
+            self._mtime = self._write(json.dumps(self._data, indent=4))
+
+def atomic_write(path, payload):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return os.stat(path).st_mtime_ns
+
+class TicketCounter:
+    # Hands out ticket numbers from memory. Numbers are reserved on disk in
+    # blocks before they are issued, so a crash can skip numbers but never
+    # reuse one. A clean shutdown gives back the unused part of the block.
+    def __init__(self, path, block_size=50):
+        self.path = path
+        self.block_size = block_size
+        self._lock = asyncio.Lock()
+        self._next = None
+        self._reserved = 0
+
+    def _read(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                return json.load(f)["counter"]
+        return 0
+
+    def _reserve(self):
+        start = self._read() + 1
+        end = start + self.block_size - 1
+        atomic_write(self.path, json.dumps({"counter": end}, indent=4))
+        return start, end
+
+    def _give_back(self):
+        atomic_write(self.path, json.dumps({"counter": self._next - 1}, indent=4))
+
+    async def next(self):
+        async with self._lock:
+            if self._next is None or self._next > self._reserved:
+                self._next, self._reserved = await asyncio.to_thread(self._reserve)
+            number = self._next
+            self._next += 1
+            return number
+
+    def release(self):
+        if self._next is not None and self._next <= self._reserved:
+            self._give_back()
+            self._reserved = self._next - 1
+
+class TicketRegistry:
+    # Open tickets of one guild keyed by channel ID. Changed records are
+    # written back per ticket in the background, so activity in one ticket
+    # never rewrites the others. The owner index only lives in memory and is
+    # rebuilt on load.
+    def __init__(self, log, flush_delay=5.0):
+        self.log = log
+        self.flush_delay = flush_delay
+        self.tickets = log.load()
+        self.by_owner = defaultdict(set)
+        self._changed = set()
+        self._flush_task = None
+        for record in self.tickets.values():
+            self._index(record)
+
+    def _index(self, record):
+        if record["owner_id"]:
+            self.by_owner[record["owner_id"]].add(record["channel_id"])
+
+    def __contains__(self, channel_id):
+        return str(channel_id) in self.tickets
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def get(self, channel_id):
+        return self.tickets.get(str(channel_id))
+
+    def owned_by(self, owner_id):
+        return self.by_owner.get(owner_id, set())
+
+    def add(self, channel_id, owner_id, ticket_type, number, created_at=None, last_activity=None):
+        created_at = created_at or time.time()
+        record = {
+            "channel_id": channel_id,
+            "owner_id": owner_id,
+            "type": ticket_type,
+            "number": number,
+            "created_at": created_at,
+            "last_activity": last_activity or created_at,
+            "warned_at": None
+        }
+        self.tickets[str(channel_id)] = record
+        self._index(record)
+        self.save(channel_id)
+        return record
+
+    def remove(self, channel_id):
+        record = self.tickets.pop(str(channel_id), None)
+        if record is None:
+            return None
+        owned = self.by_owner.get(record["owner_id"])
+        if owned is not None:
+            owned.discard(channel_id)
+            if not owned:
+                del self.by_owner[record["owner_id"]]
+        self.save(channel_id)
+        return record
+
+    def touch(self, channel_id, when=None):
+        record = self.tickets.get(str(channel_id))
+        if record is not None:
+            record["last_activity"] = when or time.time()
+            self.save(channel_id)
+
+    def idle_since(self, cutoff):
+        # A scan over open tickets only; last_activity changes with every
+        # message, so keeping it sorted would cost more than it saves
+        return [record for record in self.tickets.values() if record["last_activity"] < cutoff]
+
+    def save(self, channel_id):
+        self._changed.add(str(channel_id))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later())
+
+    def _take_changes(self):
+        # Records are flat, so a shallow copy is a stable snapshot for the
+        # writer thread; None marks a removed ticket
+        changes = {key: dict(self.tickets[key]) if key in self.tickets else None for key in self._changed}
+        self._changed.clear()
+        return changes
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        while self._changed:
+            changes = self._take_changes()
+            try:
+                await asyncio.to_thread(self.log.write, changes)
+            except OSError as e:
+                self._changed.update(changes)
+                print(f"Error saving tickets to {self.log.path}: {e}")
+                return
+
+    def flush(self):
+        if self._changed:
+            self.log.write(self._take_changes())
+
+class TicketLog:
+    # JSON backend for a TicketRegistry: the last snapshot plus an
+    # append-only log with one [channel_id, record] line per change (a null
+    # record is a removal). The log is folded into the snapshot once it has
+    # more lines than the snapshot has tickets.
+    def __init__(self, path, log_path, compact_after=1000):
+        self.path = path
+        self.log_path = log_path
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+        self._lines = 0
+        self._size = 0
+
+    def load(self):
+        with self._lock:
+            return self._load()
+
+    def _load(self):
+        tickets = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                tickets = json.load(f)["tickets"]
+        self._lines = 0
+        if os.path.exists(self.log_path):
+            good = 0
+            with open(self.log_path, 'r+b') as f:
+                for line in f:
+                    try:
+                        key, record = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    if record is None:
+                        tickets.pop(key, None)
+                    else:
+                        tickets[key] = record
+                    good += len(line)
+                    self._lines += 1
+                # Drop a line torn by a crash so later appends stay readable
+                if f.seek(0, os.SEEK_END) > good:
+                    f.truncate(good)
+        self._size = len(tickets)
+        return tickets
+
+    def write(self, changes):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            with open(self.log_path, 'a') as f:
+                for key, record in changes.items():
+                    f.write(json.dumps([key, record]) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._lines += len(changes)
+            if self._lines > max(self.compact_after, self._size):
+                self._compact()
+
+    def _compact(self):
+        # Replaying the log over the new snapshot is harmless, so a crash
+        # between the two steps loses nothing
+        tickets = self._load()
+        atomic_write(self.path, json.dumps({"tickets": tickets}))
+        os.remove(self.log_path)
+        self._lines = 0
+
+class JSONStorage:
+    # One directory of JSON files per guild; fine for a single process
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, guild_id, filename):
+        return os.path.join(self.directory, str(guild_id), filename)
+
+    def document(self, guild_id, filename, defaults, **options):
+        return ConfigStore(self.path(guild_id, filename), defaults, **options)
+
+    def counter(self, guild_id):
+        return TicketCounter(self.path(guild_id, TICKET_COUNTER_FILE))
+
+    def tickets(self, guild_id):
+        return TicketLog(self.path(guild_id, TICKET_REGISTRY_FILE), self.path(guild_id, TICKET_LOG_FILE))
+
+    def known_guilds(self):
+        if not os.path.isdir(self.directory):
+            return set()
+        return {int(name) for name in os.listdir(self.directory) if name.isdigit()}
+
+def open_sqlite(path):
+    # Only pulled in when the SQLite backend or the transcript archive is used
+    import sqlite3
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class SQLiteStorage:
+    # All guilds in one SQLite database so several shard processes can share
+    # it. Every write is its own short transaction and WAL mode lets readers
+    # carry on meanwhile. Guilds that still have JSON files are imported the
+    # first time they are read.
+    def __init__(self, path, import_from=None):
+        self.path = path
+        self.json = JSONStorage(import_from) if import_from else None
+        self._lock = threading.Lock()
+        self._conn = None
+        self._readers = threading.local()
+
+    def _connect(self):
+        if self._conn is None:
+            conn = open_sqlite(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "guild_id INTEGER, name TEXT, body TEXT, version INTEGER, PRIMARY KEY (guild_id, name))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (guild_id INTEGER PRIMARY KEY, value INTEGER)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tickets ("
+                "guild_id INTEGER, channel_id INTEGER, body TEXT, PRIMARY KEY (guild_id, channel_id))"
+            )
+            self._conn = conn
+        return self._conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so a read-modify-write
+        # can't interleave with another process
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _reader(self):
+        # Reads get a connection per thread and skip the write lock: in WAL
+        # mode they never wait for a writer, so a config read on the event
+        # loop can't queue behind another process's transaction
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            with self._lock:
+                self._connect()
+            conn = self._readers.conn = open_sqlite(self.path)
+        return conn
+
+    def query(self, sql, params=()):
+        # Always drain the cursor: a half-read statement keeps the reader's
+        # snapshot open and later reads would miss newer writes
+        rows = self.query_all(sql, params)
+        return rows[0] if rows else None
+
+    def query_all(self, sql, params=()):
+        return self._reader().execute(sql, params).fetchall()
+
+    def document(self, guild_id, filename, defaults, **options):
+        return SQLiteDocument(self, guild_id, filename, defaults, **options)
+
+    def counter(self, guild_id):
+        return SQLiteTicketCounter(self, guild_id)
+
+    def tickets(self, guild_id):
+        return SQLiteTicketLog(self, guild_id)
+
+    def known_guilds(self):
+        rows = self.query_all("SELECT guild_id FROM documents UNION SELECT guild_id FROM counters")
+        return {guild_id for guild_id, in rows} | (self.json.known_guilds() if self.json else set())
+
+class SQLiteDocument(ConfigStore):
+    def __init__(self, storage, guild_id, name, defaults, **options):
+        self.storage = storage
+        self.guild_id = guild_id
+        self.name = name
+        super().__init__(f"{storage.path}:{guild_id}/{name}", defaults, **options)
+
+    def _read(self):
+        row = self.storage.query("SELECT body, version FROM documents WHERE guild_id = ? AND name = ?", (self.guild_id, self.name))
+        if row:
+            return json.loads(row[0]), row[1]
+        if self.storage.json:
+            stored, _ = self.storage.json.document(self.guild_id, self.name, self.defaults)._read()
+            return stored, None
+        return None, None
+
+    def _version(self):
+        row = self.storage.query("SELECT version FROM documents WHERE guild_id = ? AND name = ?", (self.guild_id, self.name))
+        return row[0] if row else None
+
+    def _write(self, payload):
+        with self.storage.transaction() as conn:
+            conn.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, 1) ON CONFLICT (guild_id, name) "
+                "DO UPDATE SET body = excluded.body, version = version + 1",
+                (self.guild_id, self.name, payload)
+            )
+            return conn.execute(
+                "SELECT version FROM documents WHERE guild_id = ? AND name = ?", (self.guild_id, self.name)
+            ).fetchone()[0]
+
+class SQLiteTicketCounter(TicketCounter):
+    # Blocks are reserved inside a transaction, so processes sharing a guild
+    # get disjoint blocks. Unused numbers are only given back if nobody has
+    # reserved a block since.
+    def __init__(self, storage, guild_id, block_size=50):
+        super().__init__(f"{storage.path}:{guild_id}/counter", block_size)
+        self.storage = storage
+        self.guild_id = guild_id
+
+    def _reserve(self):
+        with self.storage.transaction() as conn:
+            row = conn.execute("SELECT value FROM counters WHERE guild_id = ?", (self.guild_id,)).fetchone()
+            if row:
+                value = row[0]
+            elif self.storage.json:
+                value = self.storage.json.counter(self.guild_id)._read()
+            else:
+                value = 0
+            end = value + self.block_size
+            conn.execute("INSERT OR REPLACE INTO counters VALUES (?, ?)", (self.guild_id, end))
+        return value + 1, end
+
+    def _give_back(self):
+        with self.storage.transaction() as conn:
+            conn.execute(
+                "UPDATE counters SET value = ? WHERE guild_id = ? AND value = ?",
+                (self._next - 1, self.guild_id, self._reserved)
+            )
+
+class SQLiteTicketLog:
+    # One row per open ticket. The registry used to be a single document;
+    # that row, or the guild's JSON files, are imported on first load and
+    # the document is left behind as a null marker so they aren't imported
+    # again once every ticket is closed. Only an import takes the write lock.
+    def __init__(self, storage, guild_id):
+        self.storage = storage
+        self.guild_id = guild_id
+        self.path = f"{storage.path}:{guild_id}/tickets"
+
+    def _pending_import(self, row):
+        # Tickets still to be moved into the tickets table, or None
+        if row:
+            return None if row[0] == "null" else json.loads(row[0])["tickets"]
+        if self.storage.json:
+            return self.storage.json.tickets(self.guild_id).load() or None
+        return None
+
+    def load(self):
+        select_marker = "SELECT body FROM documents WHERE guild_id = ? AND name = ?"
+        select_tickets = "SELECT body FROM tickets WHERE guild_id = ?"
+        params = (self.guild_id, TICKET_REGISTRY_FILE)
+        if self._pending_import(self.storage.query(select_marker, params)) is None:
+            return self._records(self.storage.query_all(select_tickets, (self.guild_id,)))
+        with self.storage.transaction() as conn:
+            # Checked again under the write lock; another process may have
+            # imported in the meantime
+            tickets = self._pending_import(conn.execute(select_marker, params).fetchone())
+            if tickets is None:
+                return self._records(conn.execute(select_tickets, (self.guild_id,)).fetchall())
+            self._write(conn, tickets)
+            conn.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, 'null', 1)", params)
+        return tickets
+
+    def _records(self, rows):
+        return {str(record["channel_id"]): record for record in (json.loads(body) for body, in rows)}
+
+    def write(self, changes):
+        with self.storage.transaction() as conn:
+            self._write(conn, changes)
+
+    def _write(self, conn, changes):
+        conn.executemany(
+            "INSERT OR REPLACE INTO tickets VALUES (?, ?, ?)",
+            [(self.guild_id, int(key), json.dumps(record)) for key, record in changes.items() if record is not None]
+        )
+        conn.executemany(
+            "DELETE FROM tickets WHERE guild_id = ? AND channel_id = ?",
+            [(self.guild_id, int(key)) for key, record in changes.items() if record is None]
+        )
+
+class GuildStore:
+    # Config stores and ticket counters are created per guild the first time
+    # the guild uses the ticket system, so idle guilds cost nothing.
+    def __init__(self, directory, storage=None):
+        self.directory = directory
+        self.storage = storage or JSONStorage(directory)
+        self.configs = {}
+        self.counters = {}
+        self.registries = {}
+        self.legacy_pending = os.path.exists(LEGACY_CONFIG_FILE)
+
+    def path(self, guild_id, filename):
+        return os.path.join(self.directory, str(guild_id), filename)
+
+    def config(self, guild) -> ConfigStore:
+        store = self.configs.get(guild.id)
+        if store is None:
+            path = self.path(guild.id, CONFIG_FILE)
+            if not os.path.exists(path):
+                self.migrate_legacy(guild)
+            store = self.configs[guild.id] = self.storage.document(guild.id, CONFIG_FILE, default_config)
+        return store
+
+    def counter(self, guild) -> TicketCounter:
+        counter = self.counters.get(guild.id)
+        if counter is None:
+            self.config(guild)
+            counter = self.counters[guild.id] = self.storage.counter(guild.id)
+        return counter
+
+    def tickets(self, guild) -> TicketRegistry:
+        registry = self.registries.get(guild.id)
+        if registry is None:
+            self.config(guild)
+            registry = self.registries[guild.id] = self._open_registry(guild.id)
+        return registry
+
+    def _open_registry(self, guild_id):
+        return TicketRegistry(self.storage.tickets(guild_id))
+
+    def preload(self, guild_ids):
+        # Reads the config and registry of every guild we have state for in
+        # one go, so on_ready doesn't hit the disk guild by guild. Guilds
+        # without a stored config are left to config() and its migration.
+        for guild_id in guild_ids:
+            if guild_id in self.configs:
+                continue
+            store = self.storage.document(guild_id, CONFIG_FILE, default_config)
+            store.load()
+            if store._mtime is None:
+                continue
+            self.configs[guild_id] = store
+            self.registries[guild_id] = self._open_registry(guild_id)
+
+    def migrate_legacy(self, guild):
+        # The old single config belongs to whichever guild owns its channels.
+        # Moving it into that guild's directory is what marks it migrated.
+        if not self.legacy_pending:
+            return False
+        if not os.path.exists(LEGACY_CONFIG_FILE):
+            self.legacy_pending = False
+            return False
+        with open(LEGACY_CONFIG_FILE, 'r') as f:
+            legacy = json.load(f)
+        channel_ids = [legacy.get("ticket_category"), legacy.get("transcript_channel")]
+        if not any(guild.get_channel(channel_id) for channel_id in channel_ids if channel_id):
+            return False
+        os.makedirs(os.path.join(self.directory, str(guild.id)), exist_ok=True)
+        os.replace(LEGACY_CONFIG_FILE, self.path(guild.id, CONFIG_FILE))
+        if os.path.exists(LEGACY_TICKET_COUNTER_FILE):
+            os.replace(LEGACY_TICKET_COUNTER_FILE, self.path(guild.id, TICKET_COUNTER_FILE))
+        self.legacy_pending = False
+        print(f"Migrated {LEGACY_CONFIG_FILE} to guild {guild.name} ({guild.id})")
+        return True
+
+    def claim_legacy(self, guilds):
+        # Checked once per process, on the first on_ready. A legacy file that
+        # matches none of our guilds is left on disk and no longer consulted.
+        claimed = next((guild for guild in guilds if self.migrate_legacy(guild)), None)
+        if claimed is None and self.legacy_pending:
+            print(f"{LEGACY_CONFIG_FILE} matches none of this bot's guilds; leaving it in place")
+            self.legacy_pending = False
+        return claimed
+
+    def flush(self):
+        for store in self.configs.values():
+            store.flush()
+        for counter in self.counters.values():
+            counter.release()
+        for registry in self.registries.values():
+            registry.flush()
+
+def open_storage():
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage(SQLITE_PATH, import_from=GUILD_DATA_DIR)
+    return JSONStorage(GUILD_DATA_DIR)
+
+guild_store = GuildStore(GUILD_DATA_DIR, open_storage())
+atexit.register(guild_store.flush)
+
+class RateLimiter:
+    # Token buckets keyed by an arbitrary id, kept in least recently used
+    # order. Past max_keys the oldest bucket is dropped; it has had the
+    # longest to refill, so it is the one closest to carrying no state.
+    def __init__(self, capacity, refill_seconds, max_keys=10000):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    def _tokens(self, key, now):
+        tokens, updated = self.buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) / self.refill_seconds)
+
+    def retry_after(self, key):
+        tokens = self._tokens(key, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) * self.refill_seconds
+
+    def consume(self, key):
+        now = time.monotonic()
+        self.buckets[key] = (self._tokens(key, now) - 1, now)
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+
+class TicketAdmission:
+    # Sits in front of create_ticket: caps open tickets per user, rate limits
+    # creation per user and per guild, and turns repeated clicks while a
+    # ticket is being created into no-ops.
+    def __init__(self):
+        self.pending = set()
+        self.user_limiter = RateLimiter(*TICKET_USER_RATE)
+        self.guild_limiter = RateLimiter(*TICKET_GUILD_RATE)
+
+    def check(self, guild_id, user_id, open_tickets, max_open):
+        key = (guild_id, user_id)
+        if key in self.pending:
+            return "Your ticket is already being created!"
+        if max_open and len(open_tickets) >= max_open:
+            mentions = ", ".join(f"<#{channel_id}>" for channel_id in open_tickets)
+            return f"You already have {len(open_tickets)} open ticket(s): {mentions}"
+        retry_after = max(self.user_limiter.retry_after(key), self.guild_limiter.retry_after(guild_id))
+        if retry_after:
+            return f"Too many tickets are being created, please try again in {int(retry_after) + 1} seconds."
+        self.user_limiter.consume(key)
+        self.guild_limiter.consume(guild_id)
+        return None
+
+    @contextlib.contextmanager
+    def creating(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        self.pending.add(key)
+        try:
+            yield
+        finally:
+            self.pending.discard(key)
+
+ticket_admission = TicketAdmission()
+
+MEMBER_CACHE_SIZE = int(os.getenv("MEMBER_CACHE_SIZE", "20000"))
+MEMBER_CACHE_TTL = 600
+
+class MemberCache:
+    # Bounded LRU of members we had to look up. The gateway cache only holds
+    # members we've seen events for, so anything else is fetched once and
+    # kept here until it expires; concurrent lookups share one fetch.
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.inflight = {}
+
+    def get(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, member = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return member
+
+    def remember(self, member):
+        key = (member.guild.id, member.id)
+        self.entries[key] = (time.monotonic() + self.ttl, member)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def forget(self, guild_id, user_id):
+        self.entries.pop((guild_id, user_id), None)
+
+    async def resolve(self, guild, user_id):
+        member = self.get(guild.id, user_id)
+        if member:
+            metrics.member_lookups["hit"] += 1
+            return member
+        member = guild.get_member(user_id)
+        if member:
+            metrics.member_lookups["gateway"] += 1
+            self.remember(member)
+            return member
+        
+        key = (guild.id, user_id)
+        if key not in self.inflight:
+            self.inflight[key] = asyncio.ensure_future(self._fetch(guild, user_id))
+            self.inflight[key].add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            metrics.member_lookups["coalesced"] += 1
+        return await asyncio.shield(self.inflight[key])
+
+    async def _fetch(self, guild, user_id):
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            metrics.member_lookups["not_found"] += 1
+            return None
+        except discord.HTTPException as e:
+            # Every caller waiting on this fetch gets a miss instead of the error
+            metrics.member_lookups["error"] += 1
+            print(f"Error fetching member {user_id} in {guild.name}: {e}")
+            return None
+        metrics.member_lookups["fetch"] += 1
+        self.remember(member)
+        return member
+
+member_cache = MemberCache(MEMBER_CACHE_SIZE, MEMBER_CACHE_TTL)
+
+async def ensure_chunked(guild):
+    # Only commands that walk the whole member list pay for downloading it
+    if not guild.chunked:
+        await guild.chunk()
 
 # ==================== TICKET SYSTEM ====================
 
@@ -55,6 +1133,7 @@ class TicketButton(discord.ui.View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label="Create Ticket", style=discord.ButtonStyle.green, custom_id="create_ticket", emoji="🎫")
+    @timed("button:create_ticket")
     async def create_ticket_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         await create_ticket(interaction)
 
@@ -72,19 +1151,96 @@ class TicketDropdown(discord.ui.View):
             discord.SelectOption(label="Other", description="Other inquiries", emoji="💬")
         ]
     )
+    @timed("select:ticket_dropdown")
     async def ticket_dropdown(self, interaction: discord.Interaction, select: discord.ui.Select):
         await create_ticket(interaction, select.values[0])
 
+POOL_CHANNEL_NAME = "pooled-ticket"
+
+class ChannelPool:
+    # Hidden channels pre-created in the ticket category. Opening a ticket
+    # renames one and sets its overwrites in a single edit instead of waiting
+    # on a channel create; a background task tops the pool back up, a few
+    # creates at a time. Pooled channels are found again by name after a
+    # restart.
+    def __init__(self, refill_concurrency=4):
+        self.refill_concurrency = refill_concurrency
+        self.channels = {}
+        self.refilling = {}
+
+    def adopt(self, guild, category):
+        pool = self.channels.get(guild.id)
+        if pool is None:
+            registry = guild_store.tickets(guild)
+            pool = self.channels[guild.id] = deque(
+                channel.id for channel in category.text_channels
+                if channel.name == POOL_CHANNEL_NAME and channel.id not in registry
+            )
+        return pool
+
+    def take(self, guild, category):
+        pool = self.adopt(guild, category)
+        while pool:
+            channel = guild.get_channel(pool.popleft())
+            if channel and channel.category_id == category.id:
+                return channel
+        return None
+
+    def give_back(self, guild, category, channel):
+        self.adopt(guild, category).append(channel.id)
+
+    def discard(self, guild_id, channel_id):
+        pool = self.channels.get(guild_id)
+        if pool and channel_id in pool:
+            pool.remove(channel_id)
+
+    def refill(self, guild, category, size):
+        task = self.refilling.get(guild.id)
+        if size and (task is None or task.done()):
+            self.refilling[guild.id] = asyncio.get_running_loop().create_task(self._refill(guild, category, size))
+
+    async def _refill(self, guild, category, size):
+        pool = self.adopt(guild, category)
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(view_channel=False),
+            guild.me: discord.PermissionOverwrite(view_channel=True)
+        }
+        while len(pool) < size:
+            created = await asyncio.gather(*(
+                category.create_text_channel(name=POOL_CHANNEL_NAME, overwrites=overwrites)
+                for _ in range(min(size - len(pool), self.refill_concurrency))
+            ), return_exceptions=True)
+            errors = [result for result in created if isinstance(result, BaseException)]
+            pool.extend(channel.id for channel in created if not isinstance(channel, BaseException))
+            if errors:
+                if not isinstance(errors[0], discord.HTTPException):
+                    raise errors[0]
+                print(f"Error refilling the ticket channel pool in {guild.name}: {errors[0]}")
+                return
+
+    async def drain(self, guild):
+        task = self.refilling.pop(guild.id, None)
+        if task:
+            task.cancel()
+        for channel_id in self.channels.pop(guild.id, ()):
+            channel = guild.get_channel(channel_id)
+            if channel:
+                with contextlib.suppress(discord.HTTPException):
+                    await channel.delete(reason="Ticket channel pool resized")
+
+ticket_pool = ChannelPool()
+
 class TicketControls(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
     
     @discord.ui.button(label="Close Ticket", style=discord.ButtonStyle.red, custom_id="close_ticket", emoji="🔒")
+    @timed("button:close_ticket")
     async def close_ticket_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         await close_ticket(interaction)
 
 async def create_ticket(interaction: discord.Interaction, ticket_type: str = "General"):
-    config = load_config()
+    config = guild_store.config(interaction.guild).data
     
     if not config["ticket_category"]:
         await interaction.response.send_message("Ticket system is not configured yet!", ephemeral=True)
@@ -95,27 +1251,56 @@ async def create_ticket(interaction: discord.Interaction, ticket_type: str = "Ge
         await interaction.response.send_message("Ticket category not found!", ephemeral=True)
         return
     
-    counter_data = load_ticket_counter()
-    counter_data["counter"] += 1
-    ticket_number = counter_data["counter"]
-    save_ticket_counter(counter_data)
-    
-    ticket_name = f"ticket-{ticket_number}"
-    
-    overwrites = {
-        interaction.guild.default_role: discord.PermissionOverwrite(view_channel=False),
-        interaction.user: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True)
-    }
-    
-    for role_id in config["support_roles"]:
-        role = interaction.guild.get_role(role_id)
-        if role:
-            overwrites[role] = discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True)
-    
-    ticket_channel = await category.create_text_channel(
-        name=ticket_name,
-        overwrites=overwrites
+    registry = guild_store.tickets(interaction.guild)
+    refusal = ticket_admission.check(
+        interaction.guild.id, interaction.user.id, registry.owned_by(interaction.user.id), config["max_tickets_per_user"]
     )
+    if refusal:
+        await interaction.response.send_message(refusal, ephemeral=True)
+        return
+    
+    # Marked pending before the first await, so a second click can't slip
+    # through check() while this one is still deferring
+    with ticket_admission.creating(interaction.guild.id, interaction.user.id):
+        # Answer within Discord's 3 second deadline no matter how slow the rest is
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        
+        ticket_number = await guild_store.counter(interaction.guild).next()
+        
+        ticket_name = f"ticket-{ticket_number}"
+        
+        overwrites = {
+            interaction.guild.default_role: discord.PermissionOverwrite(view_channel=False),
+            interaction.user: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True)
+        }
+        
+        for role_id in config["support_roles"]:
+            role = interaction.guild.get_role(role_id)
+            if role:
+                overwrites[role] = discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True)
+        
+        ticket_channel = ticket_pool.take(interaction.guild, category) if config["ticket_pool_size"] else None
+        if ticket_channel:
+            try:
+                await ticket_channel.edit(name=ticket_name, overwrites=overwrites)
+            except discord.NotFound:
+                ticket_channel = None
+            except discord.HTTPException as e:
+                # Still hidden and unused, so it can go back to the pool
+                print(f"Error opening pooled channel {ticket_channel.id}: {e}")
+                ticket_pool.give_back(interaction.guild, category, ticket_channel)
+                ticket_channel = None
+        if ticket_channel is None:
+            ticket_channel = await category.create_text_channel(
+                name=ticket_name,
+                overwrites=overwrites
+            )
+        ticket_pool.refill(interaction.guild, category, config["ticket_pool_size"])
+        registry.add(ticket_channel.id, interaction.user.id, ticket_type, ticket_number)
+        if config["auto_close_after"]:
+            # Like schedule_guild: entries hold a time to check the ticket, and
+            # process() works out the warning and close deadlines from there
+            idle_scheduler.schedule(interaction.guild.id, ticket_channel.id, time.time())
     
     embed = discord.Embed(
         title=f"Ticket #{ticket_number}",
@@ -126,48 +1311,530 @@ async def create_ticket(interaction: discord.Interaction, ticket_type: str = "Ge
     embed.set_footer(text=f"Ticket #{ticket_number}")
     
     await ticket_channel.send(embed=embed, view=TicketControls())
-    await interaction.response.send_message(f"Ticket created! {ticket_channel.mention}", ephemeral=True)
+    await interaction.followup.send(f"Ticket created! {ticket_channel.mention}", ephemeral=True)
+
+def transcript_record(message):
+    return {
+        "id": message.id,
+        "created_at": message.created_at.isoformat(),
+        "author": str(message.author),
+        "author_id": message.author.id,
+        "content": message.content,
+        "attachments": [
+            {
+                "id": attachment.id,
+                "filename": attachment.filename,
+                "url": attachment.url,
+                "size": attachment.size,
+                "content_type": attachment.content_type
+            }
+            for attachment in message.attachments
+        ],
+        "embeds": [embed.to_dict() for embed in message.embeds]
+    }
+
+class TranscriptRenderer(abc.ABC):
+    # Renders a transcript as header + one chunk per message record + footer.
+    # Everything needed from Discord objects is captured up front so the
+    # renderer can run in a worker thread.
+    extension = "txt"
+
+    def __init__(self, channel, closed_by):
+        self.channel_name = channel.name
+        self.channel_id = channel.id
+        self.closed_by = str(closed_by)
+        self.closed_by_id = closed_by.id
+        self.closed_at = datetime.utcnow()
+
+    def header(self):
+        return ""
+
+    @abc.abstractmethod
+    def render(self, record):
+        ...
+
+    def footer(self):
+        return ""
+
+class TextTranscriptRenderer(TranscriptRenderer):
+    extension = "txt"
+
+    def header(self):
+        return (
+            f"Transcript for {self.channel_name}\n"
+            f"Closed by: {self.closed_by}\n"
+            f"Closed at: {self.closed_at.strftime('%Y-%m-%d %H:%M:%S UTC')}\n"
+            + "="*50 + "\n\n"
+        )
+
+    def render(self, record):
+        created_at = datetime.fromisoformat(record["created_at"])
+        line = f"[{created_at.strftime('%Y-%m-%d %H:%M:%S')}] {record['author']}: {record['content']}\n"
+        for attachment in record["attachments"]:
+            line += f"  [Attachment: {attachment['url']}]\n"
+        return line + "\n"
+
+class JSONLTranscriptRenderer(TranscriptRenderer):
+    extension = "jsonl"
+
+    def header(self):
+        return json.dumps({
+            "channel": self.channel_name,
+            "channel_id": self.channel_id,
+            "closed_by": self.closed_by,
+            "closed_by_id": self.closed_by_id,
+            "closed_at": self.closed_at.isoformat()
+        }) + "\n"
+
+    def render(self, record):
+        return json.dumps(record) + "\n"
+
+class HTMLTranscriptRenderer(TranscriptRenderer):
+    extension = "html"
+
+    def header(self):
+        title = html.escape(f"Transcript for {self.channel_name}")
+        return (
+            f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>{title}</title>\n"
+            "<style>body{font-family:sans-serif;background:#313338;color:#dbdee1}"
+            ".message{margin:8px 0}.author{font-weight:bold;color:#f2f3f5}.time{color:#949ba4;font-size:12px}"
+            ".embed{border-left:4px solid #5865f2;padding:4px 8px;margin:4px 0;background:#2b2d31}"
+            "a{color:#00a8fc}</style>\n</head>\n<body>\n"
+            f"<h1>{title}</h1>\n"
+            f"<p>Closed by: {html.escape(self.closed_by)}<br>"
+            f"Closed at: {self.closed_at.strftime('%Y-%m-%d %H:%M:%S UTC')}</p>\n<hr>\n"
+        )
+
+    def render(self, record):
+        parts = [
+            f"<div class=\"message\" id=\"m{record['id']}\">"
+            f"<span class=\"author\" title=\"{record['author_id']}\">{html.escape(record['author'])}</span> "
+            f"<span class=\"time\">{html.escape(record['created_at'])}</span>"
+            f"<div class=\"content\">{html.escape(record['content'])}</div>"
+        ]
+        for attachment in record["attachments"]:
+            url = html.escape(attachment["url"], quote=True)
+            parts.append(f"<div class=\"attachment\"><a href=\"{url}\">{html.escape(attachment['filename'])}</a> ({attachment['size']} bytes)</div>")
+        for embed in record["embeds"]:
+            title = html.escape(embed.get("title", ""))
+            description = html.escape(embed.get("description", ""))
+            parts.append(f"<div class=\"embed\"><b>{title}</b><div>{description}</div></div>")
+        parts.append("</div>\n")
+        return "".join(parts)
+
+    def footer(self):
+        return "</body>\n</html>\n"
+
+TRANSCRIPT_RENDERERS = {
+    "text": TextTranscriptRenderer,
+    "jsonl": JSONLTranscriptRenderer,
+    "html": HTMLTranscriptRenderer
+}
+
+class TranscriptWriter:
+    # Encodes rendered chunks straight into fp, optionally through gzip.
+    # Records are also copied as JSON lines into archive when one is given;
+    # without an fp nothing is rendered and only the archive is written.
+    def __init__(self, fp, renderer, compression="none", archive=None):
+        self.fp = fp
+        self.renderer = renderer
+        self.compression = compression
+        self.archive = archive
+        self.stream = gzip.GzipFile(fileobj=fp, mode='wb') if compression == "gzip" and fp else fp
+        if self.stream:
+            self.stream.write(renderer.header().encode('utf-8'))
+
+    @property
+    def filename(self):
+        filename = f"{self.renderer.channel_name}-transcript.{self.renderer.extension}"
+        return filename + ".gz" if self.compression == "gzip" else filename
+
+    def write(self, record):
+        if self.stream:
+            self.stream.write(self.renderer.render(record).encode('utf-8'))
+        if self.archive is not None:
+            self.archive.write(json.dumps(record) + "\n")
+
+    def close(self):
+        if not self.stream:
+            return
+        self.stream.write(self.renderer.footer().encode('utf-8'))
+        if self.stream is not self.fp:
+            self.stream.close()
+        self.fp.seek(0)
+
+def transcript_writer(fp, channel, closed_by, config, archive=None) -> TranscriptWriter:
+    renderer = TRANSCRIPT_RENDERERS.get(config["transcript_format"], TextTranscriptRenderer)(channel, closed_by)
+    return TranscriptWriter(fp, renderer, config["transcript_compression"], archive)
+
+async def write_transcript(writer, channel):
+    # Messages are rendered and written one at a time as the history iterator
+    # yields them, so memory use does not grow with the length of the ticket.
+    async for message in channel.history(limit=None, oldest_first=True):
+        writer.write(transcript_record(message))
+    writer.close()
+
+class TranscriptLog:
+    # Append-only JSONL log of a ticket channel, fed by on_message when live
+    # transcripts are enabled. Anything the log missed (bot restarts, messages
+    # sent before the mode was enabled) is fetched with history(after=...) the
+    # first time the log is touched in this process and again at close time.
+    def __init__(self, path):
+        self.path = path
+        self.lock = asyncio.Lock()
+        self.last_id = None
+        self.synced = False
+
+    def _read_last_id(self):
+        # Creates the log if it's missing, so a ticket without any messages
+        # still has one to write its transcript from
+        last_id = 0
+        with open(self.path, 'a+', encoding='utf-8') as f:
+            f.seek(0)
+            for line in f:
+                record = json.loads(line)
+                if not record.get("edit"):
+                    last_id = max(last_id, record["id"])
+        return last_id
+
+    def _append(self, records):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+
+    async def _catch_up(self, channel):
+        if self.last_id is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.last_id = await asyncio.to_thread(self._read_last_id)
+        after = discord.Object(self.last_id) if self.last_id else None
+        batch = []
+        async for message in channel.history(limit=None, after=after, oldest_first=True):
+            batch.append(transcript_record(message))
+            if len(batch) >= 100:
+                await asyncio.to_thread(self._append, batch)
+                self.last_id = batch[-1]["id"]
+                batch = []
+        if batch:
+            await asyncio.to_thread(self._append, batch)
+            self.last_id = batch[-1]["id"]
+        self.synced = True
+
+    async def catch_up(self, channel):
+        async with self.lock:
+            await self._catch_up(channel)
+
+    async def record(self, message):
+        async with self.lock:
+            if not self.synced:
+                await self._catch_up(message.channel)
+            if message.id > self.last_id:
+                await asyncio.to_thread(self._append, [transcript_record(message)])
+                self.last_id = message.id
+
+    async def record_edit(self, message):
+        async with self.lock:
+            if not self.synced:
+                await self._catch_up(message.channel)
+            record = transcript_record(message)
+            record["edit"] = True
+            await asyncio.to_thread(self._append, [record])
+
+    def write_transcript(self, writer):
+        # Edits are rare, so they are collected first and applied while the
+        # log is streamed into the transcript.
+        edits = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("edit"):
+                    edits[record["id"]] = record
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if not record.get("edit"):
+                    record = edits.get(record["id"], record)
+                    record.pop("edit", None)
+                    writer.write(record)
+        writer.close()
+
+transcript_logs = {}
+
+def transcript_log_path(guild_id, channel_id):
+    return guild_store.path(guild_id, os.path.join("transcripts", f"{channel_id}.jsonl"))
+
+def transcript_log(channel) -> TranscriptLog:
+    log = transcript_logs.get(channel.id)
+    if log is None:
+        log = transcript_logs[channel.id] = TranscriptLog(transcript_log_path(channel.guild.id, channel.id))
+    return log
+
+async def discard_transcript_log(guild_id, channel_id):
+    # The log may be on disk without being loaded in this process (written
+    # before a restart), so it's removed by path either way
+    log = transcript_logs.pop(channel_id, None) or TranscriptLog(transcript_log_path(guild_id, channel_id))
+    async with log.lock:
+        try:
+            await asyncio.to_thread(os.remove, log.path)
+        except FileNotFoundError:
+            pass
+
+def fts_query(text):
+    # Every word quoted, so user input can't use (or break) FTS5 syntax
+    words = text.split()
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words) if words else None
+
+# Preset dictionary for archived message bodies: single messages are too
+# short for zlib to learn the record's keys. Never change it, existing bodies
+# can only be decompressed with the dictionary they were written with.
+ARCHIVE_ZDICT = json.dumps({
+    "id": 0, "created_at": "+00:00", "author": "", "author_id": 0, "content": "",
+    "attachments": [{"id": 0, "filename": "", "url": "https://cdn.discordapp.com/attachments/", "size": 0, "content_type": "image/png"}],
+    "embeds": [{"type": "rich", "title": "", "description": "", "color": 0, "fields": [{"name": "", "value": "", "inline": False}]}]
+}).encode('utf-8')
+
+# Raw deflate with a 4 KiB window: plenty for one message, and setting up a
+# small compressor is several times cheaper than the default 32 KiB one
+ARCHIVE_WBITS = -12
+
+def compress_body(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, ARCHIVE_WBITS, 5, zdict=ARCHIVE_ZDICT)
+    return compressor.compress(data) + compressor.flush()
+
+def decompress_body(data):
+    return zlib.decompressobj(ARCHIVE_WBITS, zdict=ARCHIVE_ZDICT).decompress(data)
+
+class TranscriptArchive:
+    # Messages of closed tickets for /ticket_search. Bodies are stored
+    # zlib-compressed; their text goes into a contentless FTS5 index keyed by
+    # message ID, so there is no second uncompressed copy.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = open_sqlite(self.path)
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tickets (
+                    channel_id INTEGER PRIMARY KEY, guild_id INTEGER, name TEXT, number INTEGER,
+                    owner_id INTEGER, closed_by INTEGER, closed_at REAL, transcript_url TEXT
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY, channel_id INTEGER, guild_id INTEGER, author_id INTEGER, body BLOB
+                );
+                CREATE INDEX IF NOT EXISTS messages_by_guild ON messages (guild_id);
+                CREATE INDEX IF NOT EXISTS messages_by_author ON messages (guild_id, author_id);
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='', columnsize=0);
+            """)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def searchable_text(record):
+        parts = [record["content"]] + [attachment["filename"] for attachment in record["attachments"]]
+        for embed in record["embeds"]:
+            parts += [embed.get("title"), embed.get("description")]
+        return "\n".join(part for part in parts if part)
+
+    def ingest(self, ticket, lines):
+        # One transaction per ticket; messages already archived are skipped,
+        # so archiving a ticket again is harmless
+        added = 0
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tickets VALUES "
+                    "(:channel_id, :guild_id, :name, :number, :owner_id, :closed_by, :closed_at, :transcript_url)",
+                    ticket
+                )
+                for line in lines:
+                    record = json.loads(line)
+                    inserted = conn.execute(
+                        "INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?)",
+                        (record["id"], ticket["channel_id"], ticket["guild_id"], record["author_id"], compress_body(line.encode('utf-8')))
+                    ).rowcount
+                    if inserted:
+                        conn.execute("INSERT INTO messages_fts (rowid, text) VALUES (?, ?)", (record["id"], self.searchable_text(record)))
+                        added += 1
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return added
+
+    def search(self, guild_id, user_id=None, text=None, after=None, before=None, cursor=None, limit=SEARCH_PAGE_SIZE):
+        # Newest first. Message IDs are snowflakes and sort by time, so they
+        # double as the date filter and as the page cursor (the last ID
+        # shown). Text searches walk the FTS index backwards by ID and stop
+        # as soon as the page is full.
+        query = fts_query(text) if text else None
+        key = "messages_fts.rowid" if query else "m.id"
+        clauses = ["m.guild_id = ?"]
+        params = [guild_id]
+        if query:
+            clauses.insert(0, "messages_fts MATCH ?")
+            params.insert(0, query)
+        if user_id:
+            clauses.append("m.author_id = ?")
+            params.append(user_id)
+        if after is not None:
+            clauses.append(f"{key} >= ?")
+            params.append(discord.utils.time_snowflake(after))
+        if before is not None:
+            clauses.append(f"{key} < ?")
+            params.append(discord.utils.time_snowflake(before))
+        if cursor:
+            clauses.append(f"{key} < ?")
+            params.append(cursor)
+        source = "messages_fts JOIN messages m ON m.id = messages_fts.rowid" if query else "messages m"
+        
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT m.id, m.author_id, m.body, t.name, t.transcript_url "
+                f"FROM {source} LEFT JOIN tickets t ON t.channel_id = m.channel_id "
+                f"WHERE {' AND '.join(clauses)} ORDER BY {key} DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [
+            {
+                "id": message_id,
+                "author_id": author_id,
+                "created_at": discord.utils.snowflake_time(message_id),
+                "record": json.loads(decompress_body(body)),
+                "ticket": name,
+                "transcript_url": transcript_url
+            }
+            for message_id, author_id, body, name, transcript_url in rows
+        ]
+
+transcript_archive = TranscriptArchive(TRANSCRIPT_ARCHIVE_PATH)
+archive_tasks = set()
+
+# Tickets whose transcript is being written, so a second close (another
+# click, /close_tickets or the idle scheduler) doesn't post it twice
+closing_tickets = set()
+
+async def archive_transcript(ticket, archived):
+    # Runs in the background so indexing never holds up closing the ticket
+    try:
+        archived.seek(0)
+        await asyncio.to_thread(transcript_archive.ingest, ticket, archived)
+    except Exception as e:
+        print(f"Error archiving the transcript of {ticket['name']}: {e}")
+    finally:
+        archived.close()
+
+async def send_transcript(channel, closed_by, config):
+    # Every closed ticket goes into the local archive; the rendered transcript
+    # is only built and uploaded when a transcript channel is configured
+    transcript_channel = channel.guild.get_channel(config["transcript_channel"]) if config["transcript_channel"] else None
+    
+    archived = tempfile.SpooledTemporaryFile(max_size=TRANSCRIPT_SPOOL_SIZE, mode='w+', encoding='utf-8')
+    message = None
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=TRANSCRIPT_SPOOL_SIZE) as transcript:
+            writer = transcript_writer(transcript if transcript_channel else None, channel, closed_by, config, archived)
+            if config["live_transcripts"]:
+                log = transcript_log(channel)
+                await log.catch_up(channel)
+                async with log.lock:
+                    await asyncio.to_thread(log.write_transcript, writer)
+            else:
+                await write_transcript(writer, channel)
+            
+            if transcript_channel:
+                file = discord.File(fp=transcript, filename=writer.filename)
+                
+                embed = discord.Embed(
+                    title=f"Ticket Closed: {channel.name}",
+                    description=f"Closed by: {closed_by.mention}",
+                    color=discord.Color.red(),
+                    timestamp=datetime.utcnow()
+                )
+                
+                message = await transcript_channel.send(embed=embed, file=file)
+    except BaseException:
+        archived.close()
+        raise
+    
+    record = guild_store.tickets(channel.guild).get(channel.id) or {}
+    ticket = {
+        "channel_id": channel.id,
+        "guild_id": channel.guild.id,
+        "name": channel.name,
+        "number": record.get("number"),
+        "owner_id": record.get("owner_id"),
+        "closed_by": closed_by.id,
+        "closed_at": time.time(),
+        "transcript_url": message.jump_url if message else None
+    }
+    task = asyncio.get_running_loop().create_task(archive_transcript(ticket, archived))
+    archive_tasks.add(task)
+    task.add_done_callback(archive_tasks.discard)
 
 async def close_ticket(interaction: discord.Interaction):
-    config = load_config()
+    config = guild_store.config(interaction.guild).data
+    registry = guild_store.tickets(interaction.guild)
     
-    if not interaction.channel.name.startswith("ticket-"):
+    if interaction.channel.id not in registry:
         await interaction.response.send_message("This command can only be used in ticket channels!", ephemeral=True)
         return
+    if interaction.channel.id in closing_tickets:
+        await interaction.response.send_message("This ticket is already being closed.", ephemeral=True)
+        return
     
-    transcript = f"Transcript for {interaction.channel.name}\n"
-    transcript += f"Closed by: {interaction.user}\n"
-    transcript += f"Closed at: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}\n"
-    transcript += "="*50 + "\n\n"
-    
-    messages = []
-    async for message in interaction.channel.history(limit=None, oldest_first=True):
-        messages.append(message)
-    
-    for message in messages:
-        transcript += f"[{message.created_at.strftime('%Y-%m-%d %H:%M:%S')}] {message.author}: {message.content}\n"
-        if message.attachments:
-            for attachment in message.attachments:
-                transcript += f"  [Attachment: {attachment.url}]\n"
-        transcript += "\n"
-    
-    if config["transcript_channel"]:
-        transcript_channel = interaction.guild.get_channel(config["transcript_channel"])
-        if transcript_channel:
-            transcript_bytes = io.BytesIO(transcript.encode('utf-8'))
-            file = discord.File(fp=transcript_bytes, filename=f"{interaction.channel.name}-transcript.txt")
-            
-            embed = discord.Embed(
-                title=f"Ticket Closed: {interaction.channel.name}",
-                description=f"Closed by: {interaction.user.mention}",
-                color=discord.Color.red(),
-                timestamp=datetime.utcnow()
-            )
-            
-            await transcript_channel.send(embed=embed, file=file)
+    closing_tickets.add(interaction.channel.id)
+    try:
+        # Long tickets take more than the 3 second response window to export
+        await interaction.response.defer(thinking=True)
+        await send_transcript(interaction.channel, interaction.user, config)
+        
+        await interaction.followup.send("Ticket will be closed in 5 seconds...")
+        await interaction.channel.delete(reason=f"Ticket closed by {interaction.user}")
+        registry.remove(interaction.channel.id)
+        await discard_transcript_log(interaction.guild.id, interaction.channel.id)
+    finally:
+        closing_tickets.discard(interaction.channel.id)
+
+async def archive_ticket(channel, closed_by, config, reason):
+    # Non-interactive close used by /close_tickets and the idle scheduler
+    if channel.id in closing_tickets:
+        return
+    closing_tickets.add(channel.id)
+    try:
+        await send_transcript(channel, closed_by, config)
+        await channel.delete(reason=reason)
+        guild_store.tickets(channel.guild).remove(channel.id)
+        await discard_transcript_log(channel.guild.id, channel.id)
+    finally:
+        closing_tickets.discard(channel.id)
+
+def reconcile_tickets(guild):
+    # Drop tickets whose channel is gone and register ticket channels the
+    # registry doesn't know about (created before it existed or while offline)
+    config = guild_store.config(guild).data
+    registry = guild_store.tickets(guild)
+    for record in list(registry.tickets.values()):
+        if guild.get_channel(record["channel_id"]) is None:
+            registry.remove(record["channel_id"])
     
-    await interaction.response.send_message("Ticket will be closed in 5 seconds...", ephemeral=False)
-    await interaction.channel.delete(reason=f"Ticket closed by {interaction.user}")
+    category = guild.get_channel(config["ticket_category"]) if config["ticket_category"] else None
+    if not category:
+        return
+    for channel in category.text_channels:
+        if not channel.name.startswith("ticket-") or channel.id in registry:
+            continue
+        owner_id = next(
+            (target.id for target in channel.overwrites if not isinstance(target, discord.Role) and target.id != guild.me.id),
+            None
+        )
+        number = channel.name.split("-", 1)[1]
+        created_at = channel.created_at.timestamp()
+        last_activity = discord.utils.snowflake_time(channel.last_message_id).timestamp() if channel.last_message_id else created_at
+        registry.add(channel.id, owner_id, None, int(number) if number.isdigit() else None, created_at, last_activity)
+    print(f"Tracking {len(registry)} open tickets in {guild.name}")
 
 # ==================== TICKET SETUP COMMANDS ====================
 
@@ -175,28 +1842,35 @@ async def close_ticket(interaction: discord.Interaction):
 @app_commands.describe(category="The category for ticket channels")
 @app_commands.checks.has_permissions(administrator=True)
 async def setup_ticket_category(interaction: discord.Interaction, category: discord.CategoryChannel):
-    config = load_config()
+    store = guild_store.config(interaction.guild)
+    config = store.data
     config["ticket_category"] = category.id
-    save_config(config)
+    store.save()
     await interaction.response.send_message(f"Ticket category set to: {category.name}", ephemeral=True)
+    
+    if config["ticket_pool_size"]:
+        await ticket_pool.drain(interaction.guild)
+        ticket_pool.refill(interaction.guild, category, config["ticket_pool_size"])
 
 @bot.tree.command(name="setup_transcript_channel", description="Set the channel where ticket transcripts will be sent")
 @app_commands.describe(channel="The channel for transcripts")
 @app_commands.checks.has_permissions(administrator=True)
 async def setup_transcript_channel(interaction: discord.Interaction, channel: discord.TextChannel):
-    config = load_config()
+    store = guild_store.config(interaction.guild)
+    config = store.data
     config["transcript_channel"] = channel.id
-    save_config(config)
+    store.save()
     await interaction.response.send_message(f"Transcript channel set to: {channel.mention}", ephemeral=True)
 
 @bot.tree.command(name="add_support_role", description="Add a role that can access tickets")
 @app_commands.describe(role="The support role")
 @app_commands.checks.has_permissions(administrator=True)
 async def add_support_role(interaction: discord.Interaction, role: discord.Role):
-    config = load_config()
+    store = guild_store.config(interaction.guild)
+    config = store.data
     if role.id not in config["support_roles"]:
         config["support_roles"].append(role.id)
-        save_config(config)
+        store.save()
         await interaction.response.send_message(f"Added {role.mention} as a support role!", ephemeral=True)
     else:
         await interaction.response.send_message(f"{role.mention} is already a support role!", ephemeral=True)
@@ -205,20 +1879,82 @@ async def add_support_role(interaction: discord.Interaction, role: discord.Role)
 @app_commands.describe(role="The support role to remove")
 @app_commands.checks.has_permissions(administrator=True)
 async def remove_support_role(interaction: discord.Interaction, role: discord.Role):
-    config = load_config()
+    store = guild_store.config(interaction.guild)
+    config = store.data
     if role.id in config["support_roles"]:
         config["support_roles"].remove(role.id)
-        save_config(config)
+        store.save()
         await interaction.response.send_message(f"Removed {role.mention} from support roles!", ephemeral=True)
     else:
         await interaction.response.send_message(f"{role.mention} is not a support role!", ephemeral=True)
 
+@bot.tree.command(name="setup_ticket_limit", description="Set how many tickets a user can have open at once")
+@app_commands.describe(max_open="Maximum open tickets per user (0 for no limit)")
+@app_commands.checks.has_permissions(administrator=True)
+async def setup_ticket_limit(interaction: discord.Interaction, max_open: app_commands.Range[int, 0, 50]):
+    store = guild_store.config(interaction.guild)
+    config = store.data
+    config["max_tickets_per_user"] = max_open
+    store.save()
+    await interaction.response.send_message(f"Users can now have {max_open or 'unlimited'} open ticket(s)!", ephemeral=True)
+
+@bot.tree.command(name="setup_transcript_format", description="Choose the file format of ticket transcripts")
+@app_commands.describe(format="Transcript file format", compression="Compress transcripts before uploading")
+@app_commands.checks.has_permissions(administrator=True)
+async def setup_transcript_format(
+    interaction: discord.Interaction,
+    format: Literal["text", "jsonl", "html"],
+    compression: Literal["none", "gzip"] = "none"
+):
+    store = guild_store.config(interaction.guild)
+    config = store.data
+    config["transcript_format"] = format
+    config["transcript_compression"] = compression
+    store.save()
+    await interaction.response.send_message(f"Transcript format set to: {format} ({compression})", ephemeral=True)
+
+@bot.tree.command(name="setup_live_transcripts", description="Record ticket transcripts as messages arrive instead of at close time")
+@app_commands.describe(enabled="Whether ticket messages should be logged as they are sent")
+@app_commands.checks.has_permissions(administrator=True)
+async def setup_live_transcripts(interaction: discord.Interaction, enabled: bool):
+    store = guild_store.config(interaction.guild)
+    config = store.data
+    config["live_transcripts"] = enabled
+    store.save()
+    await interaction.response.send_message(f"Live transcripts {'enabled' if enabled else 'disabled'}!", ephemeral=True)
+    
+    if not enabled:
+        # Logs would only go stale; closing reads the channel history instead
+        for record in list(guild_store.tickets(interaction.guild).tickets.values()):
+            await discard_transcript_log(interaction.guild.id, record["channel_id"])
+
+@bot.tree.command(name="setup_ticket_pool", description="Keep hidden ticket channels ready so new tickets open faster")
+@app_commands.describe(size="How many channels to keep ready (0 to disable)")
+@app_commands.checks.has_permissions(administrator=True)
+async def setup_ticket_pool(interaction: discord.Interaction, size: app_commands.Range[int, 0, 25]):
+    store = guild_store.config(interaction.guild)
+    config = store.data
+    category = interaction.guild.get_channel(config["ticket_category"]) if config["ticket_category"] else None
+    if size and not category:
+        await interaction.response.send_message("Set up the ticket category first!", ephemeral=True)
+        return
+    
+    config["ticket_pool_size"] = size
+    store.save()
+    await interaction.response.send_message(
+        f"Keeping {size} ticket channels ready!" if size else "Ticket channel pool disabled!", ephemeral=True
+    )
+    
+    await ticket_pool.drain(interaction.guild)
+    ticket_pool.refill(interaction.guild, category, size)
+
 @bot.tree.command(name="ticket_button", description="Send a button to create tickets")
 @app_commands.checks.has_permissions(administrator=True)
 async def ticket_button(interaction: discord.Interaction):
-    config = load_config()
+    store = guild_store.config(interaction.guild)
+    config = store.data
     config["ticket_type"] = "button"
-    save_config(config)
+    store.save()
     
     embed = discord.Embed(
         title="🎫 Support Tickets",
@@ -232,9 +1968,10 @@ async def ticket_button(interaction: discord.Interaction):
 @bot.tree.command(name="ticket_dropdown", description="Send a dropdown menu to create tickets")
 @app_commands.checks.has_permissions(administrator=True)
 async def ticket_dropdown(interaction: discord.Interaction):
-    config = load_config()
+    store = guild_store.config(interaction.guild)
+    config = store.data
     config["ticket_type"] = "dropdown"
-    save_config(config)
+    store.save()
     
     embed = discord.Embed(
         title="🎫 Support Tickets",
@@ -245,6 +1982,349 @@ async def ticket_dropdown(interaction: discord.Interaction):
     await interaction.channel.send(embed=embed, view=TicketDropdown())
     await interaction.response.send_message("Ticket dropdown sent!", ephemeral=True)
 
+# ==================== TICKET MAINTENANCE ====================
+
+DURATION_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def parse_duration(text: str):
+    text = text.strip().lower()
+    if len(text) < 2 or text[-1] not in DURATION_UNITS or not text[:-1].isdigit():
+        return None
+    return timedelta(seconds=int(text[:-1]) * DURATION_UNITS[text[-1]])
+
+def format_duration(seconds):
+    for unit, size in sorted(DURATION_UNITS.items(), key=lambda item: -item[1]):
+        if seconds >= size and seconds % size == 0:
+            return f"{int(seconds // size)}{unit}"
+    return f"{int(seconds // 60)}m"
+
+class IdleTicketScheduler:
+    # One task and one heap for every open ticket in every guild. Activity
+    # doesn't touch the heap: when an entry comes due, the real deadline is
+    # recomputed from the registry and the ticket is pushed back if it has
+    # seen activity since. Only the latest entry per channel counts. Due
+    # entries are handled in batches with a yield in between, so a guild's
+    # worth of tickets coming due at once doesn't stall the loop.
+    def __init__(self, max_concurrent_closes=4, retry_delay=60, max_retry_delay=3600, batch_size=200):
+        self.heap = []
+        self.due = {}
+        self.wakeup = asyncio.Event()
+        self.semaphore = asyncio.Semaphore(max_concurrent_closes)
+        self.tasks = set()
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.batch_size = batch_size
+        self.failures = {}
+
+    def schedule(self, guild_id, channel_id, when):
+        self.due[channel_id] = when
+        heapq.heappush(self.heap, (when, guild_id, channel_id))
+        if self.heap[0][2] == channel_id:
+            self.wakeup.set()
+
+    def schedule_guild(self, guild):
+        # Everything is due now; one heapify beats a push per ticket
+        now = time.time()
+        for record in guild_store.tickets(guild).tickets.values():
+            self.due[record["channel_id"]] = now
+            self.heap.append((now, guild.id, record["channel_id"]))
+        heapq.heapify(self.heap)
+        self.wakeup.set()
+
+    async def run(self):
+        handled = 0
+        while True:
+            if handled >= self.batch_size:
+                handled = 0
+                await asyncio.sleep(0)
+            if not self.heap:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                continue
+            when, guild_id, channel_id = heapq.heappop(self.heap)
+            handled += 1
+            if self.due.get(channel_id) != when:
+                continue
+            del self.due[channel_id]
+            try:
+                self.process(guild_id, channel_id)
+            except Exception as e:
+                print(f"Error checking idle ticket {channel_id}: {e}")
+
+    def process(self, guild_id, channel_id):
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            return
+        config = guild_store.config(guild).data
+        idle = config["auto_close_after"]
+        record = guild_store.tickets(guild).get(channel_id)
+        channel = guild.get_channel(channel_id)
+        if not idle or record is None or channel is None:
+            return
+        
+        now = time.time()
+        warning = min(config["auto_close_warning"], idle / 2)
+        warned_at = record.get("warned_at")
+        if warned_at and warned_at < record["last_activity"]:
+            warned_at = None
+        close_at = record["last_activity"] + idle
+        if warned_at:
+            close_at = max(close_at, warned_at + warning)
+        
+        if not warned_at and now < close_at - warning:
+            self.schedule(guild_id, channel_id, close_at - warning)
+        elif not warned_at:
+            record["warned_at"] = now
+            guild_store.tickets(guild).save(channel_id)
+            self.schedule(guild_id, channel_id, max(close_at, now + warning))
+            self.spawn(self.warn(channel, idle, warning))
+        elif now < close_at:
+            self.schedule(guild_id, channel_id, close_at)
+        else:
+            self.spawn(self.close(channel, config, idle))
+
+    def spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def warn(self, channel, idle, warning):
+        embed = discord.Embed(
+            title="⏰ Inactive Ticket",
+            description=f"This ticket has been inactive for {format_duration(idle - warning)} and will be closed in {format_duration(warning)} unless someone replies.",
+            color=discord.Color.orange()
+        )
+        async with self.semaphore:
+            try:
+                await channel.send(embed=embed)
+            except discord.HTTPException as e:
+                print(f"Error warning idle ticket {channel.name}: {e}")
+            except Exception:
+                print(f"Error warning idle ticket {channel.name}:")
+                traceback.print_exc()
+
+    async def close(self, channel, config, idle):
+        async with self.semaphore:
+            try:
+                await archive_ticket(channel, channel.guild.me, config, f"Ticket inactive for {format_duration(idle)}")
+            except discord.HTTPException as e:
+                # Try again later, backing off while the failures continue
+                failures = self.failures[channel.id] = self.failures.get(channel.id, 0) + 1
+                delay = min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+                print(f"Error auto-closing {channel.name}, retrying in {format_duration(delay)}: {e}")
+                self.schedule(channel.guild.id, channel.id, time.time() + delay)
+            except Exception:
+                self.failures.pop(channel.id, None)
+                print(f"Error auto-closing {channel.name}:")
+                traceback.print_exc()
+            else:
+                self.failures.pop(channel.id, None)
+
+idle_scheduler = IdleTicketScheduler()
+
+class TicketSearchView(discord.ui.View):
+    def __init__(self, user_id, search):
+        super().__init__(timeout=300)
+        self.user_id = user_id
+        self.search = search
+        self.cursors = [None]
+        self.rows = []
+    
+    async def load(self):
+        # One extra row tells us whether there is a next page
+        rows = await asyncio.to_thread(self.search, cursor=self.cursors[-1], limit=SEARCH_PAGE_SIZE + 1)
+        self.rows = rows[:SEARCH_PAGE_SIZE]
+        self.previous_button.disabled = len(self.cursors) == 1
+        self.next_button.disabled = len(rows) <= SEARCH_PAGE_SIZE
+    
+    def embed(self):
+        lines = []
+        for row in self.rows:
+            record = row["record"]
+            content = record["content"] or ", ".join(a["filename"] for a in record["attachments"]) or "*(embed)*"
+            content = content.replace("\n", " ")
+            if len(content) > 200:
+                content = content[:200] + "…"
+            ticket = row["ticket"] or "Unknown ticket"
+            if row["transcript_url"]:
+                ticket = f"[{ticket}]({row['transcript_url']})"
+            lines.append(f"**{ticket}** · <@{row['author_id']}> · <t:{int(row['created_at'].timestamp())}:f>\n{content}")
+        
+        embed = discord.Embed(
+            title="🔎 Ticket Search",
+            description="\n\n".join(lines) or "No archived messages match your search.",
+            color=discord.Color.blue()
+        )
+        embed.set_footer(text=f"Page {len(self.cursors)}")
+        return embed
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Only the person who searched can change pages!", ephemeral=True)
+            return False
+        return True
+    
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.grey)
+    async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.pop()
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+    
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.grey)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.append(self.rows[-1]["id"])
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+def parse_date(text):
+    try:
+        return datetime.strptime(text.strip(), "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+@bot.tree.command(name="ticket_search", description="Search the messages of closed tickets")
+@app_commands.describe(
+    text="Words the message must contain",
+    user="Only messages sent by this user",
+    after="Only messages sent on or after this date (YYYY-MM-DD)",
+    before="Only messages sent before this date (YYYY-MM-DD)"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def ticket_search(
+    interaction: discord.Interaction,
+    text: str = None,
+    user: discord.User = None,
+    after: str = None,
+    before: str = None
+):
+    after_date = parse_date(after) if after else None
+    before_date = parse_date(before) if before else None
+    if (after and after_date is None) or (before and before_date is None):
+        await interaction.response.send_message("Invalid date! Use YYYY-MM-DD, e.g. `2024-01-31`.", ephemeral=True)
+        return
+    if not (text or user or after or before):
+        await interaction.response.send_message("Give me some text, a user or a date range to search for!", ephemeral=True)
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    view = TicketSearchView(interaction.user.id, functools.partial(
+        transcript_archive.search,
+        interaction.guild.id,
+        user_id=user.id if user else None,
+        text=text,
+        after=after_date,
+        before=before_date
+    ))
+    await view.load()
+    await interaction.followup.send(embed=view.embed(), view=view, ephemeral=True)
+
+@bot.tree.command(name="setup_auto_close", description="Automatically close tickets after a period of inactivity")
+@app_commands.describe(
+    idle="Inactivity before a ticket is closed, e.g. 12h, 3d (or 'off')",
+    warning="How long before closing to warn the ticket, e.g. 1h"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def setup_auto_close(interaction: discord.Interaction, idle: str, warning: str = "1h"):
+    idle_delta = None if idle.strip().lower() == "off" else parse_duration(idle)
+    warning_delta = parse_duration(warning)
+    if (idle_delta is None and idle.strip().lower() != "off") or warning_delta is None:
+        await interaction.response.send_message("Invalid duration! Use a number followed by m, h, d or w (e.g. `7d`), or `off`.", ephemeral=True)
+        return
+    
+    store = guild_store.config(interaction.guild)
+    config = store.data
+    config["auto_close_after"] = int(idle_delta.total_seconds()) if idle_delta else 0
+    config["auto_close_warning"] = int(warning_delta.total_seconds())
+    store.save()
+    
+    if idle_delta:
+        idle_scheduler.schedule_guild(interaction.guild)
+        await interaction.response.send_message(f"Tickets will be closed after {idle} of inactivity, with a warning {warning} before.", ephemeral=True)
+    else:
+        await interaction.response.send_message("Auto-close disabled!", ephemeral=True)
+
+async def report_result(interaction, progress, content, **kwargs):
+    # Long jobs can outlive the 15 minute interaction token, after which
+    # neither the progress message nor a followup can be sent
+    try:
+        await progress.edit(content=content, **kwargs)
+    except discord.HTTPException:
+        try:
+            await interaction.channel.send(f"{interaction.user.mention} {content}")
+        except discord.HTTPException as e:
+            print(f"Could not report to {interaction.user}: {content} ({e})")
+
+@bot.tree.command(name="close_tickets", description="Close and archive all tickets inactive for longer than a duration")
+@app_commands.describe(
+    older_than="Inactivity threshold, e.g. 30m, 12h, 7d, 2w",
+    concurrency="How many tickets to export at once (1-10)"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def close_tickets(interaction: discord.Interaction, older_than: str, concurrency: app_commands.Range[int, 1, 10] = 4):
+    age = parse_duration(older_than)
+    if age is None:
+        await interaction.response.send_message("Invalid duration! Use a number followed by m, h, d or w (e.g. `7d`).", ephemeral=True)
+        return
+    
+    config = guild_store.config(interaction.guild).data
+    registry = guild_store.tickets(interaction.guild)
+    cutoff = time.time() - age.total_seconds()
+    stale = [interaction.guild.get_channel(record["channel_id"]) for record in registry.idle_since(cutoff)]
+    stale = [channel for channel in stale if channel]
+    if not stale:
+        await interaction.response.send_message(f"No tickets inactive for longer than {older_than}.", ephemeral=True)
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    progress = await interaction.followup.send(f"Closing {len(stale)} tickets...", ephemeral=True, wait=True)
+    
+    # The semaphore bounds how many history fetches, uploads and deletes are
+    # in flight; discord.py queues anything beyond a route's rate limit.
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    closed = 0
+    failed = 0
+    last_update = started
+    
+    async def archive(channel):
+        nonlocal closed, failed, last_update
+        async with semaphore:
+            try:
+                await archive_ticket(channel, interaction.user, config, f"Bulk ticket close by {interaction.user}")
+                closed += 1
+            except discord.HTTPException as e:
+                failed += 1
+                print(f"Error closing {channel.name}: {e}")
+            except Exception:
+                # One broken ticket mustn't stop the rest of the batch
+                failed += 1
+                print(f"Error closing {channel.name}:")
+                traceback.print_exc()
+        now = time.monotonic()
+        if now - last_update >= 2:
+            last_update = now
+            rate = (closed + failed) / (now - started)
+            try:
+                await progress.edit(content=f"Closed {closed}/{len(stale)} tickets ({failed} failed, {rate:.1f}/s)...")
+            except discord.HTTPException:
+                pass
+    
+    await asyncio.gather(*(archive(channel) for channel in stale))
+    
+    elapsed = time.monotonic() - started
+    await report_result(interaction, progress, (
+        f"Closed **{closed}** of {len(stale)} tickets in {elapsed:.1f}s "
+        f"({closed / elapsed:.1f} tickets/s). Failed: {failed}"
+    ))
+
 # ==================== ROLE MANAGEMENT ====================
 
 @bot.tree.command(name="addrole", description="Add a role to a user")
@@ -319,17 +2399,527 @@ async def timeout_cmd(interaction: discord.Interaction, member: discord.Member,
     await member.timeout(timedelta(minutes=duration), reason=reason)
     await interaction.response.send_message(f"Timed out {member.mention} for {duration} minutes | Reason: {reason}")
 
+class CancelView(discord.ui.View):
+    def __init__(self, user_id):
+        super().__init__(timeout=900)
+        self.user_id = user_id
+        self.cancelled = False
+    
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.red, emoji="✖️")
+    async def cancel_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Only the moderator who started this can cancel it!", ephemeral=True)
+            return
+        self.cancelled = True
+        button.disabled = True
+        await interaction.response.edit_message(view=self)
+
+# Bulk delete only accepts messages younger than 14 days; keep a small margin
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+# Stop looking after this many messages even if fewer matched
+CLEAR_SCAN_LIMIT = 50000
+
 @bot.tree.command(name="clear", description="Clear messages in a channel")
-@app_commands.describe(amount="Number of messages to delete (max 100)")
+@app_commands.describe(
+    amount="Number of matching messages to delete (max 10000)",
+    author="Only delete messages from this member",
+    contains="Only delete messages containing this text",
+    has_attachments="Only delete messages with (or without) attachments",
+    within="Only delete messages newer than this, e.g. 30m, 2h, 1d"
+)
 @app_commands.checks.has_permissions(manage_messages=True)
-async def clear(interaction: discord.Interaction, amount: int):
-    if amount > 100:
-        await interaction.response.send_message("You can only delete up to 100 messages at once!", ephemeral=True)
+async def clear(
+    interaction: discord.Interaction,
+    amount: app_commands.Range[int, 1, 10000],
+    author: discord.Member = None,
+    contains: str = None,
+    has_attachments: bool = None,
+    within: str = None
+):
+    after = None
+    if within:
+        window = parse_duration(within)
+        if window is None:
+            await interaction.response.send_message("Invalid duration! Use a number followed by m, h, d or w (e.g. `2h`).", ephemeral=True)
+            return
+        after = discord.utils.utcnow() - window
+    
+    def matches(message):
+        if author and message.author.id != author.id:
+            return False
+        if contains and contains.lower() not in message.content.lower():
+            return False
+        if has_attachments is not None and bool(message.attachments) != has_attachments:
+            return False
+        return True
+    
+    await interaction.response.defer(ephemeral=True)
+    view = CancelView(interaction.user.id)
+    progress = await interaction.followup.send(f"Deleting up to {amount} messages...", view=view, ephemeral=True, wait=True)
+    
+    channel = interaction.channel
+    bulk_cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    started = time.monotonic()
+    last_update = started
+    scanned = 0
+    deleted = 0
+    batch = []
+    
+    # Young messages go out in bulk-delete batches of 100; older ones can only
+    # be deleted one at a time, which discord.py paces by the route's limit.
+    async def flush_batch():
+        nonlocal deleted, batch
+        if batch:
+            await channel.delete_messages(batch)
+            deleted += len(batch)
+            batch = []
+    
+    try:
+        async for message in channel.history(limit=None, after=after, oldest_first=False):
+            scanned += 1
+            if view.cancelled or scanned > CLEAR_SCAN_LIMIT:
+                break
+            if not matches(message):
+                continue
+            if message.created_at > bulk_cutoff:
+                batch.append(message)
+                if len(batch) == 100:
+                    await flush_batch()
+            else:
+                await flush_batch()
+                try:
+                    await message.delete()
+                    deleted += 1
+                except discord.NotFound:
+                    pass
+            if deleted + len(batch) >= amount:
+                break
+            
+            now = time.monotonic()
+            if now - last_update >= 2:
+                last_update = now
+                try:
+                    await progress.edit(content=f"Deleted {deleted}/{amount} messages ({scanned} scanned)...")
+                except discord.HTTPException:
+                    pass
+        if not view.cancelled:
+            await flush_batch()
+    except discord.HTTPException as e:
+        print(f"Error clearing messages in {channel}: {e}")
+    
+    view.stop()
+    status = "Cancelled" if view.cancelled else "Done"
+    await report_result(
+        interaction, progress,
+        f"{status}! Deleted {deleted} messages ({scanned} scanned) in {time.monotonic() - started:.1f}s",
+        view=None
+    )
+
+class ConfirmView(discord.ui.View):
+    def __init__(self, user_id):
+        super().__init__(timeout=60)
+        self.user_id = user_id
+        self.confirmed = False
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Only the moderator who started this can confirm it!", ephemeral=True)
+            return False
+        return True
+    
+    @discord.ui.button(label="Confirm", style=discord.ButtonStyle.red)
+    async def confirm_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.confirmed = True
+        await interaction.response.edit_message(view=None)
+        self.stop()
+    
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.grey)
+    async def cancel_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(content="Cancelled.", view=None)
+        self.stop()
+
+# Permission each batch action requires, mirroring the single commands
+BATCH_ACTIONS = {
+    "ban": "ban_members",
+    "kick": "kick_members",
+    "timeout": "moderate_members",
+    "addrole": "manage_roles",
+    "removerole": "manage_roles"
+}
+MAX_BATCH_TARGETS = 1000
+BATCH_CONCURRENCY = 5
+BULK_BAN_SIZE = 200
+
+async def resolve_batch_targets(guild, user_ids, semaphore):
+    # Users who aren't in the guild come back as bare Objects (only bans can
+    # act on them)
+    async def resolve(user_id):
+        async with semaphore:
+            member = await member_cache.resolve(guild, user_id)
+        return member or discord.Object(user_id)
+    
+    return await asyncio.gather(*(resolve(user_id) for user_id in user_ids))
+
+@bot.tree.command(name="mass_moderate", description="Ban, kick, timeout or change roles of many members at once")
+@app_commands.describe(
+    action="What to do to every target",
+    ids="User IDs or mentions separated by spaces, commas or new lines",
+    file="A text file containing user IDs",
+    joined_within="Only members who joined within this time, e.g. 10m, 2h",
+    account_younger_than="Only accounts created within this time, e.g. 1d, 1w",
+    role="The role to add or remove (role actions only)",
+    duration="Timeout duration in minutes (timeout only)",
+    reason="Reason recorded in the audit log"
+)
+# Hidden from members without moderation rights; each action still checks
+# its own permission below
+@app_commands.default_permissions(moderate_members=True)
+async def mass_moderate(
+    interaction: discord.Interaction,
+    action: Literal["ban", "kick", "timeout", "addrole", "removerole"],
+    ids: str = None,
+    file: discord.Attachment = None,
+    joined_within: str = None,
+    account_younger_than: str = None,
+    role: discord.Role = None,
+    duration: app_commands.Range[int, 1, 40320] = 60,
+    reason: str = "No reason provided"
+):
+    guild = interaction.guild
+    if not getattr(interaction.permissions, BATCH_ACTIONS[action]):
+        await interaction.response.send_message(f"You need the `{BATCH_ACTIONS[action]}` permission for this!", ephemeral=True)
+        return
+    
+    if action in ("addrole", "removerole"):
+        if role is None:
+            await interaction.response.send_message("You need to pick a role for role actions!", ephemeral=True)
+            return
+        if role >= guild.me.top_role:
+            await interaction.response.send_message("I cannot manage this role as it's higher than my highest role!", ephemeral=True)
+            return
+    
+    joined_cutoff = account_cutoff = None
+    if joined_within or account_younger_than:
+        joined_delta = parse_duration(joined_within) if joined_within else None
+        account_delta = parse_duration(account_younger_than) if account_younger_than else None
+        if (joined_within and joined_delta is None) or (account_younger_than and account_delta is None):
+            await interaction.response.send_message("Invalid duration! Use a number followed by m, h, d or w (e.g. `10m`).", ephemeral=True)
+            return
+        now = discord.utils.utcnow()
+        joined_cutoff = now - joined_delta if joined_delta else None
+        account_cutoff = now - account_delta if account_delta else None
+    
+    if not (ids or file or joined_cutoff or account_cutoff):
+        await interaction.response.send_message("Give me user IDs, a file of IDs or a filter to select members!", ephemeral=True)
         return
     
     await interaction.response.defer(ephemeral=True)
-    deleted = await interaction.channel.purge(limit=amount)
-    await interaction.followup.send(f"Deleted {len(deleted)} messages!", ephemeral=True)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    user_ids = [int(user_id) for user_id in re.findall(r"\d{15,21}", ids or "")]
+    if file:
+        if file.size > 1024 * 1024:
+            await interaction.followup.send("That file is too large (max 1 MB)!", ephemeral=True)
+            return
+        user_ids += [int(user_id) for user_id in re.findall(rb"\d{15,21}", await file.read())]
+    
+    if user_ids:
+        user_ids = list(dict.fromkeys(user_ids))[:MAX_BATCH_TARGETS]
+        candidates = await resolve_batch_targets(guild, user_ids, semaphore)
+    else:
+        await ensure_chunked(guild)
+        candidates = guild.members
+    
+    targets = []
+    skipped = 0
+    protected = {interaction.user.id, guild.me.id, guild.owner_id}
+    for target in candidates:
+        member = target if isinstance(target, discord.Member) else None
+        if target.id in protected:
+            skipped += 1
+        elif member is None and (action != "ban" or joined_cutoff or account_cutoff):
+            skipped += 1
+        elif member and joined_cutoff and (member.joined_at is None or member.joined_at < joined_cutoff):
+            continue
+        elif member and account_cutoff and member.created_at < account_cutoff:
+            continue
+        elif member and action in ("ban", "kick", "timeout") and member.top_role >= guild.me.top_role:
+            skipped += 1
+        elif member and action == "addrole" and role in member.roles:
+            skipped += 1
+        elif member and action == "removerole" and role not in member.roles:
+            skipped += 1
+        else:
+            targets.append(target)
+    targets = targets[:MAX_BATCH_TARGETS]
+    
+    if not targets:
+        await interaction.followup.send(f"No members to {action} ({skipped} skipped).", ephemeral=True)
+        return
+    
+    view = ConfirmView(interaction.user.id)
+    await interaction.followup.send(
+        f"About to **{action}** {len(targets)} member(s) ({skipped} skipped by checks). Continue?",
+        view=view,
+        ephemeral=True
+    )
+    await view.wait()
+    if not view.confirmed:
+        return
+    
+    started = time.monotonic()
+    succeeded = 0
+    failed = 0
+    
+    async def run(target):
+        nonlocal succeeded, failed
+        async with semaphore:
+            try:
+                if action == "kick":
+                    await target.kick(reason=reason)
+                elif action == "timeout":
+                    await target.timeout(timedelta(minutes=duration), reason=reason)
+                elif action == "addrole":
+                    await target.add_roles(role, reason=reason)
+                else:
+                    await target.remove_roles(role, reason=reason)
+                succeeded += 1
+            except discord.HTTPException:
+                failed += 1
+    
+    if action == "ban":
+        # One bulk ban call per 200 users instead of one call per user
+        for start in range(0, len(targets), BULK_BAN_SIZE):
+            chunk = targets[start:start + BULK_BAN_SIZE]
+            try:
+                result = await guild.bulk_ban(chunk, reason=reason)
+                succeeded += len(result.banned)
+                failed += len(result.failed)
+            except discord.HTTPException:
+                failed += len(chunk)
+    else:
+        await asyncio.gather(*(run(target) for target in targets))
+    
+    elapsed = time.monotonic() - started
+    embed = discord.Embed(
+        title=f"✅ Mass {action.capitalize()} Complete",
+        color=discord.Color.green() if not failed else discord.Color.orange()
+    )
+    embed.add_field(name="Succeeded", value=succeeded, inline=True)
+    embed.add_field(name="Failed", value=failed, inline=True)
+    embed.add_field(name="Skipped", value=skipped, inline=True)
+    embed.add_field(name="Time", value=f"{elapsed:.1f}s ({len(targets) / elapsed:.1f}/s)" if elapsed else "0s", inline=True)
+    embed.add_field(name="Reason", value=reason, inline=False)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+# ==================== RAID PROTECTION ====================
+
+# How long the guild stays in raid mode after the join rate trips
+RAID_MODE_DURATION = 300
+YOUNG_ACCOUNT_AGE = timedelta(days=7)
+RECENT_NAMES = 50
+
+def name_skeleton(name):
+    return re.sub(r"[\W\d_]+", "", name.lower())[:16]
+
+class JoinRateMonitor:
+    # Join times live in fixed-size rings holding the last `threshold` joins
+    # (and suspicious joins), so checking the rate is one comparison against
+    # the oldest slot: O(1) per join and constant memory per guild.
+    def __init__(self, threshold, window):
+        self.threshold = threshold
+        self.window = window
+        self.joins = [float("-inf")] * threshold
+        self.join_index = 0
+        self.suspicious = [float("-inf")] * max(3, threshold // 2)
+        self.suspicious_index = 0
+        self.recent = deque(maxlen=threshold * 5)
+        self.names = deque(maxlen=RECENT_NAMES)
+        self.name_counts = Counter()
+        self.raid_until = 0.0
+
+    def suspicion(self, member, now):
+        # Feature sketch: young account, default avatar, name shaped like
+        # other recent joiners
+        score = 0
+        if now - member.created_at.timestamp() < YOUNG_ACCOUNT_AGE.total_seconds():
+            score += 1
+        if member.avatar is None:
+            score += 1
+        skeleton = name_skeleton(member.name)
+        if skeleton and self.name_counts[skeleton] >= 2:
+            score += 1
+        if len(self.names) == self.names.maxlen:
+            evicted = self.names[0]
+            self.name_counts[evicted] -= 1
+            if not self.name_counts[evicted]:
+                del self.name_counts[evicted]
+        self.names.append(skeleton)
+        self.name_counts[skeleton] += 1
+        return score
+
+    def observe(self, member, now):
+        # Returns True when this join starts a raid
+        suspicious = self.suspicion(member, now) >= 2
+        self.recent.append((now, member.id))
+        
+        oldest = self.joins[self.join_index]
+        self.joins[self.join_index] = now
+        self.join_index = (self.join_index + 1) % len(self.joins)
+        tripped = now - oldest <= self.window
+        
+        if suspicious:
+            oldest = self.suspicious[self.suspicious_index]
+            self.suspicious[self.suspicious_index] = now
+            self.suspicious_index = (self.suspicious_index + 1) % len(self.suspicious)
+            tripped = tripped or now - oldest <= self.window
+        
+        if tripped and now >= self.raid_until:
+            self.raid_until = now + RAID_MODE_DURATION
+            return True
+        if tripped:
+            self.raid_until = now + RAID_MODE_DURATION
+        return False
+
+    def in_raid(self, now):
+        return now < self.raid_until
+
+    def joined_since(self, cutoff):
+        return [member_id for joined, member_id in self.recent if joined >= cutoff]
+
+join_monitors = {}
+raid_tasks = set()
+raid_semaphore = asyncio.Semaphore(5)
+
+def join_monitor(guild, config) -> JoinRateMonitor:
+    monitor = join_monitors.get(guild.id)
+    if monitor is None or monitor.threshold != config["raid_joins"] or monitor.window != config["raid_seconds"]:
+        monitor = join_monitors[guild.id] = JoinRateMonitor(config["raid_joins"], config["raid_seconds"])
+    return monitor
+
+def spawn_raid_task(coro):
+    task = asyncio.get_running_loop().create_task(coro)
+    raid_tasks.add(task)
+    task.add_done_callback(raid_tasks.discard)
+
+async def raid_timeout(member, minutes):
+    if member.top_role >= member.guild.me.top_role:
+        return
+    async with raid_semaphore:
+        try:
+            await member.timeout(timedelta(minutes=minutes), reason="Raid protection")
+        except discord.HTTPException as e:
+            print(f"Error timing out {member} during raid: {e}")
+
+async def set_lockdown(guild, enabled, reason):
+    # Deny @everyone send_messages in every text channel, remembering the
+    # previous value in the config so it can be restored after a restart
+    store = guild_store.config(guild)
+    config = store.data
+    everyone = guild.default_role
+    
+    async def update(channel, send_messages):
+        overwrite = channel.overwrites_for(everyone)
+        overwrite.send_messages = send_messages
+        async with raid_semaphore:
+            try:
+                await channel.set_permissions(everyone, overwrite=overwrite, reason=reason)
+            except discord.HTTPException as e:
+                print(f"Error updating lockdown in {channel}: {e}")
+    
+    if enabled:
+        channels = [c for c in guild.text_channels if str(c.id) not in config["raid_lockdown"]]
+        for channel in channels:
+            config["raid_lockdown"][str(channel.id)] = channel.overwrites_for(everyone).send_messages
+        store.save()
+        await asyncio.gather(*(update(channel, False) for channel in channels))
+        return len(channels)
+    
+    previous = config["raid_lockdown"]
+    config["raid_lockdown"] = {}
+    store.save()
+    channels = [(guild.get_channel(int(channel_id)), value) for channel_id, value in previous.items()]
+    await asyncio.gather(*(update(channel, value) for channel, value in channels if channel))
+    return len(channels)
+
+async def raid_alert(guild, config, message):
+    print(f"[raid] {guild.name} ({guild.id}): {message}")
+    channel = guild.get_channel(config["raid_alert_channel"]) if config["raid_alert_channel"] else None
+    if channel:
+        embed = discord.Embed(title="🚨 Raid Detected", description=message, color=discord.Color.red(), timestamp=datetime.utcnow())
+        try:
+            await channel.send(embed=embed)
+        except discord.HTTPException as e:
+            print(f"Error sending raid alert: {e}")
+
+@bot.listen('on_member_join')
+async def detect_raid(member: discord.Member):
+    config = guild_store.config(member.guild).data
+    if not config["raid_protection"]:
+        return
+    guild = member.guild
+    member_cache.remember(member)
+    monitor = join_monitor(guild, config)
+    now = time.time()
+    started = monitor.observe(member, now)
+    action = config["raid_action"]
+    
+    if started:
+        message = f"{config['raid_joins']}+ joins within {config['raid_seconds']}s. Action: **{action}**."
+        spawn_raid_task(raid_alert(guild, config, message))
+        if action == "lockdown":
+            spawn_raid_task(set_lockdown(guild, True, "Raid protection"))
+        elif action == "timeout":
+            # Everyone who joined inside the triggering window
+            for member_id in monitor.joined_since(now - monitor.window):
+                raider = member_cache.get(guild.id, member_id) or guild.get_member(member_id)
+                if raider:
+                    spawn_raid_task(raid_timeout(raider, config["raid_timeout_minutes"]))
+    elif monitor.in_raid(now) and action == "timeout":
+        spawn_raid_task(raid_timeout(member, config["raid_timeout_minutes"]))
+
+@bot.tree.command(name="setup_raid_protection", description="Configure automatic raid detection on member joins")
+@app_commands.describe(
+    enabled="Whether raid protection is on",
+    joins="Number of joins that counts as a raid",
+    seconds="Time window for those joins",
+    action="What to do when a raid is detected",
+    timeout_minutes="Timeout length for raiders (timeout action only)",
+    alert_channel="Channel to post raid alerts in"
+)
+@app_commands.checks.has_permissions(administrator=True)
+async def setup_raid_protection(
+    interaction: discord.Interaction,
+    enabled: bool,
+    joins: app_commands.Range[int, 3, 500] = 10,
+    seconds: app_commands.Range[int, 1, 600] = 10,
+    action: Literal["alert", "timeout", "lockdown"] = "alert",
+    timeout_minutes: app_commands.Range[int, 1, 40320] = 60,
+    alert_channel: discord.TextChannel = None
+):
+    store = guild_store.config(interaction.guild)
+    config = store.data
+    config["raid_protection"] = enabled
+    config["raid_joins"] = joins
+    config["raid_seconds"] = seconds
+    config["raid_action"] = action
+    config["raid_timeout_minutes"] = timeout_minutes
+    config["raid_alert_channel"] = alert_channel.id if alert_channel else None
+    store.save()
+    if enabled:
+        await interaction.response.send_message(f"Raid protection on: {joins} joins within {seconds}s triggers **{action}**.", ephemeral=True)
+    else:
+        await interaction.response.send_message("Raid protection off!", ephemeral=True)
+
+@bot.tree.command(name="raid_lockdown", description="Stop @everyone from sending messages in all text channels, or lift it")
+@app_commands.describe(enabled="True to lock the server down, False to lift the lockdown")
+@app_commands.checks.has_permissions(administrator=True)
+async def raid_lockdown(interaction: discord.Interaction, enabled: bool):
+    await interaction.response.defer(ephemeral=True)
+    if not enabled:
+        join_monitors.pop(interaction.guild.id, None)
+    count = await set_lockdown(interaction.guild, enabled, f"Lockdown {'started' if enabled else 'lifted'} by {interaction.user}")
+    await interaction.followup.send(f"{'Locked' if enabled else 'Unlocked'} {count} channels!", ephemeral=True)
 
 # ==================== UTILITY COMMANDS ====================
 
@@ -340,7 +2930,7 @@ async def serverinfo(interaction: discord.Interaction):
     embed = discord.Embed(title=f"{guild.name} Server Information", color=discord.Color.blue())
     embed.set_thumbnail(url=guild.icon.url if guild.icon else None)
     embed.add_field(name="Server ID", value=guild.id, inline=True)
-    embed.add_field(name="Owner", value=guild.owner.mention, inline=True)
+    embed.add_field(name="Owner", value=f"<@{guild.owner_id}>", inline=True)
     embed.add_field(name="Members", value=guild.member_count, inline=True)
     embed.add_field(name="Roles", value=len(guild.roles), inline=True)
     embed.add_field(name="Channels", value=len(guild.channels), inline=True)
@@ -352,6 +2942,7 @@ async def serverinfo(interaction: discord.Interaction):
 @app_commands.describe(member="The member to get info about")
 async def userinfo(interaction: discord.Interaction, member: discord.Member = None):
     member = member or interaction.user
+    member_cache.remember(member)
     
     embed = discord.Embed(title=f"{member} User Information", color=member.color)
     embed.set_thumbnail(url=member.avatar.url if member.avatar else None)
@@ -386,12 +2977,26 @@ async def help_command(interaction: discord.Interaction):
             "`/setup_transcript_channel` - Set the channel where ticket transcripts will be saved\n"
             "`/add_support_role` - Add a role that can view and manage tickets\n"
             "`/remove_support_role` - Remove a support role\n"
+            "`/setup_ticket_limit <max_open>` - Limit how many tickets a user can have open at once\n"
+            "`/setup_transcript_format <format> [compression]` - Choose text, JSONL or HTML transcripts, optionally gzipped\n"
+            "`/setup_live_transcripts <enabled>` - Log ticket messages as they arrive for faster closing\n"
             "`/ticket_button` - Send a button in the current channel to create tickets\n"
             "`/ticket_dropdown` - Send a dropdown menu to create tickets with different types"
         ),
         inline=False
     )
     
+    embed.add_field(
+        name="🧹 **Ticket Maintenance**",
+        value=(
+            "`/close_tickets <older_than> [concurrency]` - Close and archive all tickets inactive for a duration\n"
+            "`/setup_auto_close <idle> [warning]` - Automatically warn and close inactive tickets\n"
+            "`/setup_ticket_pool <size>` - Keep hidden channels ready so tickets open instantly\n"
+            "`/ticket_search [text] [user] [after] [before]` - Search the messages of closed tickets"
+        ),
+        inline=False
+    )
+    
     embed.add_field(
         name="👥 **Role Management**",
         value=(
@@ -408,7 +3013,10 @@ async def help_command(interaction: discord.Interaction):
             "`/ban <member> [reason]` - Ban a member from the server\n"
             "`/unban <user_id>` - Unban a user by their ID\n"
             "`/timeout <member> <minutes> [reason]` - Timeout a member for specified minutes\n"
-            "`/clear <amount>` - Delete up to 100 messages in the current channel"
+            "`/clear <amount> [author] [contains] [has_attachments] [within]` - Delete up to 10000 matching messages in the current channel\n"
+            "`/mass_moderate <action> [ids] [file] [joined_within] [account_younger_than]` - Ban, kick, timeout or change roles of many members at once\n"
+            "`/setup_raid_protection <enabled> [joins] [seconds] [action]` - Detect join raids and alert, timeout or lock down\n"
+            "`/raid_lockdown <enabled>` - Lock or unlock all text channels for @everyone"
         ),
         inline=False
     )
@@ -493,11 +3101,13 @@ async def dump(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
     
     try:
-        synced = await bot.tree.sync()
+        results = await sync_commands(force=True)
+        synced = next(iter(results.values()), [])
+        scopes = ", ".join(results)
         
         embed = discord.Embed(
             title="✅ Commands Synced",
-            description=f"Successfully synced **{len(synced)}** slash commands!",
+            description=f"Successfully synced **{len(synced)}** slash commands! ({scopes})",
             color=discord.Color.green()
         )
         
@@ -520,21 +3130,152 @@ async def dump(interaction: discord.Interaction):
 
 # ==================== BOT EVENTS ====================
 
+# Hash of the last synced command payload per application and scope
+COMMAND_SYNC_FILE = "command_sync.json"
+# Comma-separated guild IDs: sync there instantly instead of globally
+DEV_GUILD_IDS = [int(guild_id) for guild_id in os.getenv("DEV_GUILD_IDS", "").split(",") if guild_id.strip()]
+
+def command_tree_hash(guild=None):
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands(guild=guild)]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands(force=False):
+    # Global syncs are slow to propagate and heavily rate limited, so only
+    # sync a scope when its serialized command tree has changed
+    hashes = {}
+    if os.path.exists(COMMAND_SYNC_FILE):
+        with open(COMMAND_SYNC_FILE, 'r') as f:
+            hashes = json.load(f)
+    
+    results = {}
+    for guild in [discord.Object(guild_id) for guild_id in DEV_GUILD_IDS] or [None]:
+        if guild:
+            bot.tree.copy_global_to(guild=guild)
+        scope = f"guild {guild.id}" if guild else "global"
+        key = f"{bot.application_id}:{scope}"
+        digest = command_tree_hash(guild)
+        if not force and hashes.get(key) == digest:
+            print(f"Commands unchanged ({scope}), skipping sync")
+            continue
+        results[scope] = await bot.tree.sync(guild=guild)
+        hashes[key] = digest
+    
+    if results:
+        await asyncio.to_thread(atomic_write, COMMAND_SYNC_FILE, json.dumps(hashes, indent=4))
+    return results
+
 @bot.event
 async def on_ready():
     print(f"Bot is ready! Logged in as {bot.user}")
     print(f"Bot ID: {bot.user.id}")
+    if not startup.ready:
+        startup.mark("gateway connect")
     
-    bot.add_view(TicketButton())
-    bot.add_view(TicketDropdown())
-    bot.add_view(TicketControls())
+    known_guilds = guild_store.storage.known_guilds()
+    if guild_store.legacy_pending:
+        claimed = guild_store.claim_legacy(bot.guilds)
+        if claimed:
+            known_guilds.add(claimed.id)
+    for guild in bot.guilds:
+        if guild.id in known_guilds:
+            reconcile_tickets(guild)
+            config = guild_store.config(guild).data
+            if config["auto_close_after"]:
+                idle_scheduler.schedule_guild(guild)
+            category = guild.get_channel(config["ticket_category"]) if config["ticket_category"] else None
+            if category and config["ticket_pool_size"]:
+                ticket_pool.refill(guild, category, config["ticket_pool_size"])
     
+    if not startup.ready:
+        startup.ready = True
+        startup.mark("reconcile tickets")
+        if startup.enabled:
+            await asyncio.gather(*startup.background, return_exceptions=True)
+            print(startup.report())
+            await bot.close()
+
+async def sync_commands_in_background():
     try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} commands")
-        print(f"Commands: {[cmd.name for cmd in synced]}")
+        for scope, synced in (await sync_commands()).items():
+            print(f"Synced {len(synced)} commands ({scope})")
     except Exception as e:
         print(f"Error syncing commands: {e}")
 
+@bot.event
+async def setup_hook():
+    # Runs once per process after login, before connecting to the gateway,
+    # unlike on_ready which fires on every reconnect. Anything slow that
+    # tickets don't depend on is left to background tasks.
+    startup.mark("login")
+    bot.add_view(TicketButton())
+    bot.add_view(TicketDropdown())
+    bot.add_view(TicketControls())
+    startup.mark("persistent views")
+    
+    await asyncio.to_thread(guild_store.preload, guild_store.storage.known_guilds())
+    startup.mark("load guild state")
+    
+    # With several shard processes, only the one running shard 0 syncs
+    if SHARD_IDS is None or 0 in SHARD_IDS:
+        startup.spawn("command sync", sync_commands_in_background())
+    
+    loop = asyncio.get_running_loop()
+    loop.create_task(LoopWatchdog(LOOP_BLOCK_THRESHOLD).run())
+    loop.create_task(idle_scheduler.run())
+    if METRICS_LOG_INTERVAL > 0:
+        loop.create_task(log_metrics(METRICS_LOG_INTERVAL))
+    if METRICS_PORT:
+        await serve_metrics(METRICS_PORT)
+        startup.mark("metrics server")
+
+@bot.listen('on_app_command_completion')
+async def record_command_latency(interaction: discord.Interaction, command):
+    started = interaction.extras.get("started")
+    if started is not None:
+        metrics.observe(command.qualified_name, time.perf_counter() - started)
+
+@bot.listen('on_member_update')
+async def refresh_cached_member(before: discord.Member, after: discord.Member):
+    if member_cache.get(after.guild.id, after.id):
+        member_cache.remember(after)
+
+@bot.listen('on_raw_member_remove')
+async def forget_cached_member(payload: discord.RawMemberRemoveEvent):
+    member_cache.forget(payload.guild_id, payload.user.id)
+
+@bot.listen('on_guild_channel_delete')
+async def forget_deleted_ticket(channel: discord.abc.GuildChannel):
+    registry = guild_store.registries.get(channel.guild.id)
+    if registry and registry.remove(channel.id):
+        # Deleted by hand rather than closed
+        await discard_transcript_log(channel.guild.id, channel.id)
+    ticket_pool.discard(channel.guild.id, channel.id)
+
+@bot.listen('on_message')
+async def record_ticket_message(message: discord.Message):
+    if message.guild is None:
+        return
+    registry = guild_store.registries.get(message.guild.id)
+    if registry is None or message.channel.id not in registry:
+        return
+    if not message.author.bot:
+        registry.touch(message.channel.id, message.created_at.timestamp())
+    if guild_store.config(message.guild).data["live_transcripts"]:
+        await transcript_log(message.channel).record(message)
+
+@bot.listen('on_message_edit')
+async def record_ticket_message_edit(before: discord.Message, after: discord.Message):
+    if after.guild is None:
+        return
+    registry = guild_store.registries.get(after.guild.id)
+    if registry is None or after.channel.id not in registry:
+        return
+    if guild_store.config(after.guild).data["live_transcripts"]:
+        await transcript_log(after.channel).record_edit(after)
+
 # Run the bot
-bot.run('os.getenv('TOKEN')')
+if __name__ == "__main__":
+    # --profile-startup prints how long each startup phase took and exits
+    startup.enabled = "--profile-startup" in sys.argv[1:]
+    startup.mark("commands and views")
+    bot.run(os.getenv('TOKEN'))
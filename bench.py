@@ -0,0 +1,855 @@
+"""Offline benchmarks for PDFhunter's ticket and moderation hot paths.
+
+Runs the real command code against an in-process stand-in for Discord, so no
+token or network connection is needed:
+
+    python bench.py                         # all scenarios with defaults
+    python bench.py create_ticket --concurrency 200 --iterations 2000
+    python bench.py close_ticket --messages 20000 --latency 50
+    python bench.py --json results.json --max-block-ms 50
+
+Each scenario reports p50/p99 latency, throughput and how long the event loop
+was blocked. --max-block-ms / --max-p99-ms turn the run into a CI check.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import discord
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import PDFhunter  # noqa: E402
+
+_ids = itertools.count(1)
+
+def snowflake(when=None):
+    when = when or datetime.now(timezone.utc)
+    return discord.utils.time_snowflake(when) + next(_ids) % 4096
+
+# ==================== FAKE DISCORD ====================
+
+class Latency:
+    # Simulated round-trip time for a REST call, in seconds
+    def __init__(self, mean=0.0, jitter=0.0):
+        self.mean = mean
+        self.jitter = jitter
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.mean or self.jitter:
+            await asyncio.sleep(max(0.0, random.gauss(self.mean, self.jitter)))
+        else:
+            await asyncio.sleep(0)
+
+class FakeRole:
+    def __init__(self, name, position=1):
+        self.id = snowflake()
+        self.name = name
+        self.position = position
+        self.mention = f"<@&{self.id}>"
+
+    def __ge__(self, other):
+        return self.position >= other.position
+
+    def __lt__(self, other):
+        return self.position < other.position
+
+class FakeUser:
+    def __init__(self, name, bot=False):
+        self.id = snowflake()
+        self.name = name
+        self.bot = bot
+        self.mention = f"<@{self.id}>"
+        self.avatar = None
+        self.created_at = datetime.now(timezone.utc) - timedelta(days=365)
+
+    def __str__(self):
+        return self.name
+
+class FakeMember(FakeUser):
+    def __init__(self, name, guild, roles=(), bot=False):
+        super().__init__(name, bot)
+        self.guild = guild
+        self.nick = None
+        self.color = discord.Color.default()
+        self.joined_at = datetime.now(timezone.utc) - timedelta(days=30)
+        self.roles = [guild.default_role, *roles]
+
+    @property
+    def top_role(self):
+        return max(self.roles, key=lambda role: role.position)
+
+class FakeAttachment:
+    def __init__(self, filename):
+        self.id = snowflake()
+        self.filename = filename
+        self.url = f"https://cdn.example.invalid/attachments/{self.id}/{filename}"
+        self.size = random.randint(1_000, 5_000_000)
+        self.content_type = "image/png"
+
+class FakeMessage:
+    def __init__(self, channel, author, content="", created_at=None, embeds=(), attachments=()):
+        self.created_at = created_at or datetime.now(timezone.utc)
+        self.id = snowflake(self.created_at)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = list(embeds)
+        self.attachments = list(attachments)
+        self.jump_url = f"https://discord.com/channels/{self.guild.id}/{channel.id}/{self.id}"
+
+    async def delete(self):
+        await self.guild.latency()
+        self.channel.messages.remove(self)
+
+class FakeTextChannel:
+    def __init__(self, guild, name, category=None, overwrites=None):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.category = category
+        self.category_id = category.id if category else None
+        self.overwrites = overwrites or {}
+        self.created_at = datetime.now(timezone.utc)
+        self.mention = f"<#{self.id}>"
+        self.messages = []
+        self.uploads = []
+        self.deleted = False
+
+    @property
+    def last_message_id(self):
+        return self.messages[-1].id if self.messages else None
+
+    async def send(self, content=None, *, embed=None, file=None, view=None):
+        await self.guild.latency()
+        if file is not None:
+            self.uploads.append((file.filename, len(file.fp.read())))
+        message = FakeMessage(self, self.guild.me, content or "", embeds=[embed] if embed else [])
+        self.messages.append(message)
+        return message
+
+    async def history(self, limit=100, after=None, oldest_first=None):
+        # Pages of 100 messages, one simulated REST call per page
+        messages = self.messages if oldest_first else list(reversed(self.messages))
+        if after is not None:
+            after_id = discord.utils.time_snowflake(after) if isinstance(after, datetime) else after.id
+            messages = [m for m in messages if m.id > after_id]
+        if limit is not None:
+            messages = messages[:limit]
+        for start in range(0, max(len(messages), 1), 100):
+            await self.guild.latency()
+            for message in messages[start:start + 100]:
+                yield message
+
+    async def delete_messages(self, messages):
+        await self.guild.latency()
+        doomed = {message.id for message in messages}
+        self.messages = [message for message in self.messages if message.id not in doomed]
+
+    async def edit(self, name=None, overwrites=None, reason=None):
+        await self.guild.latency()
+        if name is not None:
+            self.name = name
+        if overwrites is not None:
+            self.overwrites = overwrites
+
+    async def delete(self, reason=None):
+        await self.guild.latency()
+        self.deleted = True
+        self.guild.channels.pop(self.id, None)
+        if self.category:
+            self.category.text_channels.remove(self)
+
+class FakeCategoryChannel:
+    def __init__(self, guild, name):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.text_channels = []
+
+    async def create_text_channel(self, name, overwrites=None):
+        await self.guild.latency()
+        if self.guild.create_latency:
+            await asyncio.sleep(self.guild.create_latency)
+        channel = FakeTextChannel(self.guild, name, self, overwrites)
+        self.text_channels.append(channel)
+        self.guild.channels[channel.id] = channel
+        return channel
+
+class FakeGuild:
+    def __init__(self, name="Benchmark Guild", latency=None, guild_id=None):
+        self.id = guild_id or snowflake()
+        self.name = name
+        self.latency = latency or Latency()
+        # Extra time channel creation takes on top of an ordinary REST call
+        self.create_latency = 0.0
+        self.channels = {}
+        self.default_role = FakeRole("@everyone", position=0)
+        self.roles = [self.default_role]
+        self.members = []
+        self.me = FakeMember("PDFhunter", self, [self.create_role("Bot", position=100)], bot=True)
+
+    def create_role(self, name, position=1):
+        role = FakeRole(name, position)
+        self.roles.append(role)
+        return role
+
+    def create_member(self, name, roles=()):
+        member = FakeMember(name, self, roles)
+        self.members.append(member)
+        return member
+
+    def create_category(self, name):
+        category = FakeCategoryChannel(self, name)
+        self.channels[category.id] = category
+        return category
+
+    def create_text_channel(self, name, category=None):
+        channel = FakeTextChannel(self, name, category)
+        self.channels[channel.id] = channel
+        if category:
+            category.text_channels.append(channel)
+        return channel
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self):
+        if self._done:
+            raise RuntimeError("Interaction has already been responded to")
+        await self.interaction.guild.latency()
+        self._done = True
+        self.interaction.first_response = time.perf_counter()
+
+    async def send_message(self, content=None, *, embed=None, ephemeral=False, view=None):
+        await self._respond()
+        self.interaction.sent.append(content)
+
+    async def defer(self, ephemeral=False, thinking=False):
+        await self._respond()
+
+class FakeWebhookMessage:
+    def __init__(self, interaction, content):
+        self.interaction = interaction
+        self.content = content
+
+    async def edit(self, content=None, embed=None, view=None):
+        await self.interaction.guild.latency()
+        self.content = content
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, *, embed=None, view=None, ephemeral=False, wait=False):
+        await self.interaction.guild.latency()
+        self.interaction.sent.append(content)
+        return FakeWebhookMessage(self.interaction, content)
+
+class FakeInteraction:
+    def __init__(self, guild, user, channel=None):
+        self.guild = guild
+        self.user = user
+        self.channel = channel
+        self.sent = []
+        self.created = time.perf_counter()
+        self.first_response = None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+def fill_channel(channel, count, authors, attachment_every=50, embed_every=200):
+    start = datetime.now(timezone.utc) - timedelta(seconds=count)
+    for i in range(count):
+        channel.messages.append(FakeMessage(
+            channel,
+            authors[i % len(authors)],
+            f"Message {i}: " + "lorem ipsum dolor sit amet " * random.randint(1, 8),
+            created_at=start + timedelta(seconds=i),
+            embeds=[discord.Embed(title=f"Embed {i}", description="details")] if i % embed_every == 0 else [],
+            attachments=[FakeAttachment(f"file{i}.png")] if i % attachment_every == 0 else []
+        ))
+
+def setup_guild(latency, guild_id=None):
+    guild = FakeGuild(latency=latency, guild_id=guild_id)
+    category = guild.create_category("Tickets")
+    transcripts = guild.create_text_channel("transcripts")
+    support = guild.create_role("Support", position=5)
+    config = PDFhunter.guild_store.config(guild).data
+    config["ticket_category"] = category.id
+    config["transcript_channel"] = transcripts.id
+    config["support_roles"] = [support.id]
+    return guild, category, transcripts
+
+# ==================== MEASUREMENT ====================
+
+class LoopMonitor:
+    # Measures how long the event loop was unable to run a 1ms ticker
+    def __init__(self, interval=0.001, threshold=0.005):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_block = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - started - self.interval
+            if lag > self.threshold:
+                self.blocked += lag
+                self.max_block = max(self.max_block, lag)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+async def measure(name, factory, iterations, concurrency, **extra):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def run_one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await factory(i)
+            latencies.append(time.perf_counter() - started)
+
+    with LoopMonitor() as monitor:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_one(i) for i in range(iterations)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "scenario": name,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput": iterations / elapsed if elapsed else 0.0,
+        "loop_blocked_ms": monitor.blocked * 1000,
+        "max_block_ms": monitor.max_block * 1000,
+        **extra
+    }
+
+# ==================== SCENARIOS ====================
+
+async def bench_counter(args):
+    # Thousands of concurrent next() calls across block boundaries. A clean
+    # reload (release, then a fresh counter on the same file) must continue
+    # without duplicates or gaps; a crash may skip the rest of a block but
+    # must never reuse a number.
+    results = []
+    backends = {
+        "json": lambda: PDFhunter.TicketCounter(os.path.abspath("counter.json"), block_size=args.counter_block),
+        "sqlite": lambda: PDFhunter.SQLiteStorage(os.path.abspath("counter.db")).counter(1)
+    }
+    for name, make_counter in backends.items():
+        issued = []
+        counter = make_counter()
+        counter.block_size = args.counter_block
+        started = time.perf_counter()
+        issued += await asyncio.gather(*(counter.next() for _ in range(args.counter_calls)))
+        elapsed = time.perf_counter() - started
+        counter.release()
+
+        # Clean restart in the middle of a block
+        counter = make_counter()
+        counter.block_size = args.counter_block
+        issued += await asyncio.gather(*(counter.next() for _ in range(args.counter_block // 2 + 1)))
+        counter.release()
+        contiguous = sorted(issued) == list(range(1, len(issued) + 1))
+
+        # Crash: the reserved block is never given back
+        counter = make_counter()
+        counter.block_size = args.counter_block
+        issued += await asyncio.gather(*(counter.next() for _ in range(3)))
+        counter = make_counter()
+        counter.block_size = args.counter_block
+        issued += await asyncio.gather(*(counter.next() for _ in range(3)))
+
+        results.append({
+            "scenario": f"counter[{name}]",
+            "calls": len(issued),
+            "block_size": args.counter_block,
+            "calls_per_s": args.counter_calls / elapsed,
+            "unique_numbers": len(set(issued)) == len(issued),
+            "no_gaps": contiguous
+        })
+    return results
+
+async def bench_create_ticket(args):
+    guild, category, _ = setup_guild(Latency(args.latency / 1000, args.jitter / 1000))
+    users = [guild.create_member(f"user{i}") for i in range(args.iterations)]
+    # Every user is distinct; lift the per-guild limit so all tickets get created
+    PDFhunter.ticket_admission.guild_limiter = PDFhunter.RateLimiter(args.iterations, 1)
+
+    async def create(i):
+        await PDFhunter.create_ticket(FakeInteraction(guild, users[i]))
+
+    result = await measure("create_ticket", create, args.iterations, args.concurrency)
+    names = [channel.name for channel in category.text_channels]
+    result["unique_numbers"] = len(set(names)) == len(names) == args.iterations
+    return [result]
+
+async def bench_ticket_open(args):
+    # Time to first response and time until the ticket channel exists, with
+    # and without a warm channel pool. Channel creation is made slower than
+    # other calls (--create-latency), as it is on Discord. The fake has no
+    # per-route rate limits, so refills run faster than Discord would let
+    # them: a burst the refill can't keep pace with falls back to creates.
+    results = []
+    for pool_size in (0, args.pool_size):
+        guild, category, _ = setup_guild(Latency(args.latency / 1000, args.jitter / 1000))
+        guild.create_latency = args.create_latency / 1000
+        users = [guild.create_member(f"user{i}") for i in range(args.iterations)]
+        PDFhunter.ticket_admission.guild_limiter = PDFhunter.RateLimiter(args.iterations, 1)
+        PDFhunter.guild_store.config(guild).data["ticket_pool_size"] = pool_size
+        if pool_size:
+            await PDFhunter.ticket_pool._refill(guild, category, pool_size)
+        first_responses = []
+        guild.latency.calls = 0
+
+        async def open_ticket(i):
+            interaction = FakeInteraction(guild, users[i])
+            await PDFhunter.create_ticket(interaction)
+            first_responses.append(interaction.first_response - interaction.created)
+
+        name = f"ticket_open[pool={pool_size}]"
+        result = await measure(name, open_ticket, args.iterations, args.concurrency)
+        result["first_response_p50_ms"] = percentile(sorted(first_responses), 50) * 1000
+        result["first_response_p99_ms"] = percentile(sorted(first_responses), 99) * 1000
+        task = PDFhunter.ticket_pool.refilling.get(guild.id)
+        if task:
+            await task
+        result["pool_refilled"] = len(PDFhunter.ticket_pool.channels.get(guild.id, ())) == pool_size
+        results.append(result)
+    return results
+
+async def bench_ticket_spam(args):
+    # A few users spam-clicking: admission control should create at most
+    # max_tickets_per_user channels each and answer every other click
+    guild, category, _ = setup_guild(Latency(args.latency / 1000, args.jitter / 1000))
+    users = [guild.create_member(f"spammer{i}") for i in range(10)]
+    guild.latency.calls = 0
+
+    async def click(i):
+        interaction = FakeInteraction(guild, users[i % len(users)])
+        await PDFhunter.create_ticket(interaction)
+        assert interaction.response.is_done()
+
+    result = await measure("ticket_spam", click, args.iterations, args.concurrency)
+    result["channels_created"] = len(category.text_channels)
+    result["api_calls"] = guild.latency.calls
+    return [result]
+
+async def bench_close_ticket(args):
+    results = []
+    for live in (False, True):
+        guild, category, transcripts = setup_guild(Latency(args.latency / 1000, args.jitter / 1000))
+        PDFhunter.guild_store.config(guild).data["live_transcripts"] = live
+        authors = [guild.create_member(f"user{i}") for i in range(5)]
+        channels = []
+        for i in range(args.tickets):
+            channel = guild.create_text_channel(f"ticket-{i + 1}", category)
+            PDFhunter.guild_store.tickets(guild).add(channel.id, authors[0].id, "General", i + 1)
+            fill_channel(channel, args.messages, authors)
+            channels.append(channel)
+            if live:
+                # What the on_message listener would have recorded already
+                await PDFhunter.transcript_log(channel).catch_up(channel)
+                fill_channel(channel, 10, authors)
+        guild.latency.calls = 0
+        first_responses = []
+
+        async def close(i):
+            # Discord drops interactions not answered within 3 seconds
+            interaction = FakeInteraction(guild, authors[0], channels[i])
+            await PDFhunter.close_ticket(interaction)
+            first_responses.append(interaction.first_response - interaction.created)
+
+        name = "close_ticket[live]" if live else "close_ticket[full]"
+        result = await measure(name, close, args.tickets, args.concurrency, messages=args.messages)
+        result["first_response_p99_ms"] = percentile(sorted(first_responses), 99) * 1000
+        result["api_calls"] = guild.latency.calls
+        result["uploaded_bytes"] = sum(size for _, size in transcripts.uploads)
+        results.append(result)
+    return results
+
+async def bench_clear(args):
+    guild, _, _ = setup_guild(Latency(args.latency / 1000, args.jitter / 1000))
+    moderator = guild.create_member("mod")
+    channels = []
+    spammer = guild.create_member("spammer")
+    for i in range(args.iterations):
+        channel = guild.create_text_channel(f"general-{i}")
+        # Interleaved spam, some of it too old for bulk delete
+        fill_channel(channel, args.clear_messages, [moderator, spammer, spammer])
+        for message in channel.messages[:args.clear_messages // 20]:
+            message.created_at -= timedelta(days=30)
+        channels.append(channel)
+    guild.latency.calls = 0
+
+    async def clear(i):
+        await PDFhunter.clear.callback(FakeInteraction(guild, moderator, channels[i]), args.clear_messages, author=spammer)
+
+    result = await measure("clear", clear, args.iterations, args.concurrency, messages=args.clear_messages)
+    result["api_calls"] = guild.latency.calls
+    result["left_over_spam"] = sum(m.author is spammer for c in channels for m in c.messages)
+    return [result]
+
+async def bench_setup(args):
+    guild, category, transcripts = setup_guild(Latency(args.latency / 1000, args.jitter / 1000))
+    admin = guild.create_member("admin")
+    roles = [guild.create_role(f"Support {i}") for i in range(args.iterations)]
+    commands = [
+        lambda i: PDFhunter.setup_ticket_category.callback(FakeInteraction(guild, admin), category),
+        lambda i: PDFhunter.setup_transcript_channel.callback(FakeInteraction(guild, admin), transcripts),
+        lambda i: PDFhunter.add_support_role.callback(FakeInteraction(guild, admin), roles[i]),
+        lambda i: PDFhunter.remove_support_role.callback(FakeInteraction(guild, admin), roles[i]),
+    ]
+
+    async def setup(i):
+        await commands[i % len(commands)](i)
+
+    return [await measure("setup_commands", setup, args.iterations, args.concurrency)]
+
+async def bench_render(args):
+    # Render time and output size per transcript format, without API latency
+    guild, _, _ = setup_guild(Latency())
+    authors = [guild.create_member(f"user{i}") for i in range(5)]
+    results = []
+    for count in args.render_sizes:
+        channel = guild.create_text_channel(f"ticket-render-{count}")
+        fill_channel(channel, count, authors)
+        records = [PDFhunter.transcript_record(message) for message in channel.messages]
+        for fmt in PDFhunter.TRANSCRIPT_RENDERERS:
+            for compression in ("none", "gzip"):
+                config = {"transcript_format": fmt, "transcript_compression": compression}
+                with tempfile.SpooledTemporaryFile(max_size=PDFhunter.TRANSCRIPT_SPOOL_SIZE) as fp:
+                    started = time.perf_counter()
+                    writer = PDFhunter.transcript_writer(fp, channel, authors[0], config)
+                    for record in records:
+                        writer.write(record)
+                    writer.close()
+                    elapsed = time.perf_counter() - started
+                    size = fp.seek(0, os.SEEK_END)
+                results.append({
+                    "scenario": f"render[{fmt},{compression}]",
+                    "messages": count,
+                    "render_ms": elapsed * 1000,
+                    "messages_per_s": count / elapsed if elapsed else 0.0,
+                    "size_kib": size / 1024
+                })
+    return results
+
+async def bench_raid(args):
+    # Replays a synthetic join stream through the join-rate monitor: a long
+    # background trickle of normal members, then a burst of fresh accounts
+    # with similar names
+    guild = FakeGuild()
+    config = dict(PDFhunter.default_config, raid_protection=True)
+    monitor = PDFhunter.JoinRateMonitor(config["raid_joins"], config["raid_seconds"])
+    now = time.time()
+    stream = []
+    for i in range(args.raid_background):
+        member = FakeMember(f"{random.choice(['alex', 'sam', 'kim', 'jo'])}{random.choice(['_', '.', ''])}{random.randint(0, 99999)}", guild)
+        member.avatar = "custom"
+        now += random.expovariate(1 / 10)
+        stream.append((now, member, False))
+    for i in range(args.raid_burst):
+        member = FakeMember(f"raider{random.randint(1000, 9999)}", guild)
+        member.created_at = datetime.now(timezone.utc) - timedelta(hours=1)
+        now += random.expovariate(args.raid_burst / 60)
+        stream.append((now, member, True))
+
+    false_alarms = 0
+    raiders = 0
+    detected_at = None
+    started = time.perf_counter()
+    for joined, member, raider in stream:
+        raiders += raider
+        if monitor.observe(member, joined):
+            if not raider:
+                false_alarms += 1
+            elif detected_at is None:
+                detected_at = raiders
+    elapsed = time.perf_counter() - started
+    return [{
+        "scenario": "raid_replay",
+        "joins": len(stream),
+        "ns_per_join": elapsed / len(stream) * 1e9,
+        "joins_per_s": len(stream) / elapsed,
+        "false_alarms": false_alarms,
+        "detected_after_raiders": detected_at
+    }]
+
+async def bench_archive(args):
+    # Ingest rate of the transcript archive and /ticket_search query latency.
+    # Words follow a Zipf-like distribution so there are both very common
+    # and rare terms to search for.
+    archive = PDFhunter.TranscriptArchive(os.path.abspath("archive.db"))
+    vocabulary = list({"".join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(5000)})
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    guild_id = snowflake()
+    users = [snowflake() for _ in range(200)]
+    per_ticket = 1000
+    tickets = max(1, args.archive_messages // per_ticket)
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    step = timedelta(days=365) / (tickets * per_ticket)
+
+    ingest_time = 0.0
+    raw_bytes = 0
+    for t in range(tickets):
+        lines = []
+        for i in range(per_ticket):
+            created_at = start + step * (t * per_ticket + i)
+            lines.append(json.dumps({
+                "id": snowflake(created_at),
+                "created_at": created_at.isoformat(),
+                "author": f"user{i % 5}",
+                "author_id": random.choice(users),
+                "content": " ".join(random.choices(vocabulary, cum_weights=weights, k=random.randint(3, 30))),
+                "attachments": [],
+                "embeds": []
+            }) + "\n")
+        raw_bytes += sum(len(line) for line in lines)
+        ticket = {
+            "channel_id": snowflake(), "guild_id": guild_id, "name": f"ticket-{t + 1}", "number": t + 1,
+            "owner_id": users[t % len(users)], "closed_by": users[0], "closed_at": time.time(), "transcript_url": None
+        }
+        started = time.perf_counter()
+        archive.ingest(ticket, lines)
+        ingest_time += time.perf_counter() - started
+
+    messages = tickets * per_ticket
+    archive._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db_bytes = os.path.getsize("archive.db")
+    results = [{
+        "scenario": "archive_ingest",
+        "messages": messages,
+        "messages_per_s": messages / ingest_time,
+        "raw_mib": raw_bytes / 2 ** 20,
+        "db_mib": db_bytes / 2 ** 20
+    }]
+
+    end = start + step * messages
+    queries = {
+        "common_word": lambda: {"text": vocabulary[0]},
+        "rare_word": lambda: {"text": random.choice(vocabulary[-1000:])},
+        "two_words": lambda: {"text": " ".join(random.sample(vocabulary[:50], 2))},
+        "user": lambda: {"user_id": random.choice(users)},
+        "user_and_word": lambda: {"user_id": random.choice(users), "text": random.choice(vocabulary[:20])},
+        "month": lambda: {"after": start + (end - start) * random.random(), "before": None},
+        "page_5": lambda: {"text": vocabulary[1], "pages": 5}
+    }
+    for name, make_query in queries.items():
+        latencies = []
+        found = 0
+        for _ in range(args.queries):
+            query = make_query()
+            pages = query.pop("pages", 1)
+            if "after" in query:
+                query["before"] = query["after"] + timedelta(days=30)
+            started = time.perf_counter()
+            cursor = None
+            for _ in range(pages):
+                rows = archive.search(guild_id, cursor=cursor, limit=PDFhunter.SEARCH_PAGE_SIZE + 1, **query)
+                if len(rows) <= PDFhunter.SEARCH_PAGE_SIZE:
+                    break
+                cursor = rows[PDFhunter.SEARCH_PAGE_SIZE - 1]["id"]
+            latencies.append(time.perf_counter() - started)
+            found += len(rows[:PDFhunter.SEARCH_PAGE_SIZE])
+        results.append({
+            "scenario": f"archive_search[{name}]",
+            "queries": args.queries,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "avg_results": found / args.queries
+        })
+    return results
+
+def shard_worker(db_path, shared_guild_id, own_guild_id, tickets):
+    # One shard process: opens tickets in a guild only it owns and, to stress
+    # the counter, in a guild every process writes to
+    PDFhunter.guild_store = PDFhunter.GuildStore(PDFhunter.GUILD_DATA_DIR, PDFhunter.SQLiteStorage(db_path))
+    PDFhunter.ticket_admission.guild_limiter = PDFhunter.RateLimiter(2 * tickets, 1)
+
+    async def run():
+        shared, shared_category, _ = setup_guild(Latency(), shared_guild_id)
+        own, own_category, _ = setup_guild(Latency(), own_guild_id)
+        users = [shared.create_member(f"user{i}") for i in range(tickets)]
+        await asyncio.gather(*(
+            PDFhunter.create_ticket(FakeInteraction(guild, user))
+            for user in users for guild in (shared, own)
+        ))
+        PDFhunter.guild_store.flush()
+        return (
+            [channel.name for channel in shared_category.text_channels],
+            [channel.id for channel in own_category.text_channels]
+        )
+
+    return asyncio.run(run())
+
+async def bench_shards(args):
+    # Several processes sharing one SQLite database, like shard workers
+    db_path = os.path.abspath("shards.db")
+    shared_guild_id = snowflake()
+    own_guild_ids = [snowflake() for _ in range(args.shards)]
+    tickets = max(1, args.iterations // args.shards)
+    context = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+        args.shards, mp_context=context, initializer=os.chdir, initargs=(os.getcwd(),)
+    ) as pool:
+        outcomes = list(pool.map(
+            shard_worker, [db_path] * args.shards, [shared_guild_id] * args.shards, own_guild_ids, [tickets] * args.shards
+        ))
+    elapsed = time.perf_counter() - started
+
+    shared_names = [name for names, _ in outcomes for name in names]
+    storage = PDFhunter.SQLiteStorage(db_path)
+    registries_ok = all(
+        set(storage.tickets(guild_id).load()) == {str(i) for i in channel_ids}
+        for guild_id, (_, channel_ids) in zip(own_guild_ids, outcomes)
+    )
+    # A restarted process must continue after every number already issued
+    issued = [int(name.split("-")[1]) for name in shared_names]
+    next_number = await storage.counter(shared_guild_id).next()
+    return [{
+        "scenario": f"shards[{args.shards}]",
+        "tickets": len(shared_names) * 2,
+        "elapsed_s": elapsed,
+        "unique_numbers": len(set(shared_names)) == len(shared_names) == tickets * args.shards and next_number > max(issued),
+        "registries_ok": registries_ok
+    }]
+
+SCENARIOS = {
+    "counter": bench_counter,
+    "create_ticket": bench_create_ticket,
+    "ticket_open": bench_ticket_open,
+    "ticket_spam": bench_ticket_spam,
+    "close_ticket": bench_close_ticket,
+    "clear": bench_clear,
+    "setup": bench_setup,
+    "render": bench_render,
+    "raid": bench_raid,
+    "archive": bench_archive,
+    "shards": bench_shards
+}
+
+def print_results(results):
+    for result in results:
+        fields = ", ".join(
+            f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in result.items() if key != "scenario"
+        )
+        print(f"{result['scenario']:<28} {fields}")
+
+async def main(args):
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        scenario_results = await SCENARIOS[name](args)
+        print_results(scenario_results)
+        results.extend(scenario_results)
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline PDFhunter benchmarks")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--iterations", type=int, default=500, help="Operations per scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="Operations in flight at once")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated API latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the latency in ms")
+    parser.add_argument("--counter-calls", type=int, default=5000, help="Concurrent next() calls in counter")
+    parser.add_argument("--counter-block", type=int, default=50, help="Numbers reserved per block in counter")
+    parser.add_argument("--create-latency", type=float, default=250.0, help="Extra latency of creating a channel in ms (ticket_open)")
+    parser.add_argument("--pool-size", type=int, default=25, help="Warm channel pool size for ticket_open")
+    parser.add_argument("--tickets", type=int, default=10, help="Tickets closed by close_ticket")
+    parser.add_argument("--messages", type=int, default=5000, help="Messages per closed ticket")
+    parser.add_argument("--clear-messages", type=int, default=1000, help="Messages per channel for clear")
+    parser.add_argument("--archive-messages", type=int, default=200_000, help="Messages ingested by archive")
+    parser.add_argument("--queries", type=int, default=50, help="Searches per query type in archive")
+    parser.add_argument("--shards", type=int, default=4, help="Processes started by shards")
+    parser.add_argument("--raid-background", type=int, default=100_000, help="Normal joins replayed before the raid")
+    parser.add_argument("--raid-burst", type=int, default=500, help="Raid joins replayed (over one minute)")
+    parser.add_argument("--render-sizes", type=int, nargs="+", default=[10_000, 100_000], help="Message counts for render")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON")
+    parser.add_argument("--max-block-ms", type=float, help="Fail if the loop was blocked longer than this in one go")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if any scenario's p99 latency exceeds this")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    random.seed(0)
+    # The bot keeps its state relative to the working directory, so each run
+    # gets a scratch directory that is removed afterwards. Shard workers
+    # are pointed at the same one.
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="pdfhunter-bench-") as workdir:
+        os.chdir(workdir)
+        try:
+            results = asyncio.run(main(args))
+        finally:
+            # Written now rather than by the bot's atexit hook, which would
+            # run after we've left the directory
+            PDFhunter.guild_store.flush()
+            os.chdir(original_cwd)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    failures = []
+    for result in results:
+        if args.max_block_ms is not None and result.get("max_block_ms", 0) > args.max_block_ms:
+            failures.append(f"{result['scenario']}: loop blocked {result['max_block_ms']:.1f}ms")
+        if args.max_p99_ms is not None and result.get("p99_ms", 0) > args.max_p99_ms:
+            failures.append(f"{result['scenario']}: p99 {result['p99_ms']:.1f}ms")
+        if result.get("unique_numbers") is False:
+            failures.append(f"{result['scenario']}: duplicate ticket numbers")
+        if result.get("no_gaps") is False:
+            failures.append(f"{result['scenario']}: ticket numbers skipped after a clean restart")
+        if result.get("registries_ok") is False:
+            failures.append(f"{result['scenario']}: ticket registry lost updates")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)